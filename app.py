@@ -5,19 +5,51 @@ import logging
 import os
 import shutil
 import time
-from contextlib import asynccontextmanager
-from tempfile import TemporaryDirectory
-from typing import Annotated, Any, Dict, List
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import AsyncExitStack, asynccontextmanager
+from tempfile import gettempdir, mkdtemp
+from typing import Annotated, Any, Dict, List, Optional, Tuple
 
-import aiofiles
-from fastapi import Depends, FastAPI, HTTPException, Request, status
+from fastapi import Depends, FastAPI, HTTPException, Request, Response, status
 from fastapi.middleware.cors import CORSMiddleware
-from starlette.datastructures import FormData, UploadFile
-
+from fastapi.responses import StreamingResponse
+
+from cache import (
+    DiskCache,
+    MemoryCache,
+    ResultCache,
+    UncachedResult,
+    result_cache_key,
+)
 from config import settings
+from context import build_feedback
+from deadline import clamp, remaining
+from jobs import (
+    Job,
+    JobQueue,
+    MemoryJobStore,
+    QueueFull,
+    SqliteJobStore,
+    report_progress,
+)
+from images import PIL_AVAILABLE, parse_byte_budget, shrink_result_images
+from ingest import convert_uploads, needs_conversion
+from limits import AdmissionController, SandboxLimits, executions_per_worker
 from logging_config import setup_logging
-from middlewares import TimeoutMiddleware
-from services import LLMClient, UVCodeInterpreter
+from middlewares import TimeoutMiddleware, timeout_response
+from package_cache import PackageCache
+from plan_cache import PlanCache, collect_schemas, plan_fingerprint, session_plan
+from planner import QuestionPlan, SubTask, split_questions
+from metrics import CONTENT_TYPE_LATEST, render_latest
+from pool import VenvPool, remove_stale_pools
+from profiling import build_initial_prompt
+from providers import ProviderRegistry, load_sdk
+from schemas import GeneratedCode
+from services import ForkServer, LLMClient, UVCodeInterpreter
+from speculative import copy_inputs, first_success
+from timing import increment, phase, set_attribute
+from uploads import UploadedFile, save_files_to_temp_dir
+from validator import validate
 
 setup_logging()
 log = logging.getLogger(__name__)
@@ -27,13 +59,182 @@ app_state = {}
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    log.info("Application startup: Initializing LLMClient...")
-    # app_state["llm_client"] = LLMClient(settings.gemini_api_key)
+    log.info("Application startup: Initializing LLM providers...")
+    app_state["started_at"] = time.monotonic()
+    app_state["providers"] = ProviderRegistry(
+        settings.gemini_api_key,
+        settings.digital_ocean_model_access_key,
+        settings.digital_ocean_model_access_base_url,
+        settings.llm_max_connections,
+        settings.llm_keepalive_expiry,
+    )
+    # Only the configured provider's SDK is imported, in the background so
+    # startup isn't held up by it.
+    sdk_load = asyncio.create_task(asyncio.to_thread(load_sdk, settings.llm_provider))
+    sdk_load.add_done_callback(_log_sdk_load)
+    # Every server process gets its own pool directory, prebuilt venvs from
+    # gunicorn's master are claimed out of the shared "prewarmed" one.
+    remove_stale_pools(settings.venv_pool_dir)
+    venv_pool = VenvPool(
+        os.path.join(settings.venv_pool_dir, f"worker-{os.getpid()}"),
+        settings.venv_pool_size,
+        os.path.join(settings.venv_pool_dir, "prewarmed"),
+    )
+    await venv_pool.start()
+    app_state["venv_pool"] = venv_pool
+    app_state["query_limiter"] = asyncio.Semaphore(settings.max_concurrent_queries)
+    app_state["admission"] = AdmissionController(
+        settings.max_concurrent_executions
+        or executions_per_worker(settings.workers),
+        settings.admission_min_free_memory_bytes,
+    )
+    app_state["sandbox_limits"] = SandboxLimits(
+        memory_bytes=settings.sandbox_memory_bytes,
+        cpu_seconds=settings.sandbox_cpu_seconds,
+        max_processes=settings.sandbox_max_processes,
+        max_file_bytes=settings.sandbox_max_file_bytes,
+        max_output_bytes=settings.sandbox_max_output_bytes,
+        threads=settings.sandbox_threads,
+        cpus=settings.sandbox_cpus,
+    )
+    package_cache = PackageCache(
+        settings.package_cache_dir,
+        settings.base_packages,
+        settings.package_cache_max_bytes,
+    )
+    app_state["package_cache"] = package_cache
+    # The base stack takes a while to install the first time, until it is
+    # ready requested libraries simply resolve to overlays.
+    base_build = asyncio.create_task(package_cache.build_base())
+    base_build.add_done_callback(_log_base_build)
+    app_state["forkserver"] = None
+    if settings.forkserver_enabled:
+        forkserver_start = asyncio.create_task(start_forkserver(base_build))
+    # Background startup work /api/v1/ready waits for.
+    app_state["startup_tasks"] = {
+        "provider_sdk": sdk_load,
+        "base_packages": base_build,
+        **({"forkserver": forkserver_start} if settings.forkserver_enabled else {}),
+    }
+    app_state["result_cache"] = build_result_cache()
+    # Recompressing oversized images is CPU bound, it runs off the event loop.
+    app_state["image_pool"] = (
+        ProcessPoolExecutor(settings.image_workers)
+        if settings.image_recompress_enabled and PIL_AVAILABLE
+        else None
+    )
+    job_store = (
+        SqliteJobStore(
+            settings.job_store_path, settings.job_max_stored, settings.job_ttl
+        )
+        if settings.job_store == "sqlite"
+        else MemoryJobStore(settings.job_max_stored, settings.job_ttl)
+    )
+    job_queue = JobQueue(
+        job_store,
+        settings.job_workers,
+        settings.job_queue_size,
+        settings.job_timeout,
+    )
+    job_queue.start()
+    app_state["job_queue"] = job_queue
+    app_state["plan_cache"] = (
+        PlanCache(
+            [
+                DiskCache(
+                    settings.plan_cache_path,
+                    settings.plan_cache_max_bytes,
+                    settings.plan_cache_ttl,
+                )
+            ]
+        )
+        if settings.plan_cache_enabled
+        else None
+    )
     yield
     log.info("Application shutdown: Cleaning up resources.")
+    await job_queue.close()
+    await venv_pool.close()
+    await app_state["providers"].aclose()
+    if settings.forkserver_enabled:
+        forkserver_start.cancel()
+        if app_state["forkserver"]:
+            await app_state["forkserver"].stop()
+    if app_state["image_pool"]:
+        app_state["image_pool"].shutdown(cancel_futures=True)
     app_state.clear()
 
 
+def build_result_cache() -> Optional[ResultCache]:
+    if not settings.result_cache_enabled:
+        return None
+    backends = []
+    for backend in settings.result_cache_backends:
+        if backend == "memory":
+            backends.append(
+                MemoryCache(
+                    settings.result_cache_max_entries,
+                    settings.result_cache_max_bytes,
+                    settings.result_cache_ttl,
+                )
+            )
+        else:
+            backends.append(
+                DiskCache(
+                    settings.result_cache_path,
+                    settings.result_cache_max_bytes,
+                    settings.result_cache_ttl,
+                )
+            )
+    return ResultCache(backends)
+
+
+def _log_sdk_load(task: asyncio.Task):
+    if not task.cancelled() and task.exception():
+        provider = settings.llm_provider
+        log.error(f"Failed to import the {provider} SDK: {task.exception()}")
+
+
+def _startup_error(task: asyncio.Task) -> Optional[str]:
+    if not task.done() or task.cancelled() or task.exception() is None:
+        return None
+    return repr(task.exception())
+
+
+def _log_base_build(task: asyncio.Task):
+    if not task.cancelled() and task.exception():
+        log.error(f"Failed to build base package environment: {task.exception()}")
+
+
+async def start_forkserver(base_build: asyncio.Task):
+    """
+    Starts this process's kernel forkserver once the base environment it
+    imports from is built. Until then, or if it fails, kernels start as
+    separate processes.
+    """
+    await asyncio.wait([base_build])
+    package_cache: PackageCache = app_state["package_cache"]
+    if not package_cache.base_site_packages:
+        log.warning("No base environment, kernels start without the forkserver.")
+        return
+    forkserver = ForkServer(
+        os.path.join(package_cache.base_path, "bin", "python"),
+        [package_cache.base_site_packages],
+        os.path.join(gettempdir(), f"tds-forkserver-{os.getpid()}.sock"),
+        settings.forkserver_preload,
+        app_state["sandbox_limits"],
+    )
+    try:
+        await forkserver.start()
+    except asyncio.CancelledError:
+        await forkserver.stop()
+        raise
+    except (OSError, RuntimeError) as e:
+        log.warning(f"Forkserver failed to start, kernels start as processes: {e}")
+        return
+    app_state["forkserver"] = forkserver
+
+
 app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
@@ -43,35 +244,14 @@ app.add_middleware(TimeoutMiddleware, settings.response_timeout)
 
 
 def get_llm_client() -> LLMClient:
-    return LLMClient(
-        settings.gemini_api_key,
-        settings.digital_ocean_model_access_key,
-        settings.digital_ocean_model_access_base_url,
+    providers: ProviderRegistry = app_state["providers"]
+    return providers.session(
         settings.llm_provider,
+        settings.llm_context_token_budget,
+        settings.llm_context_keep_recent,
     )
 
 
-async def save_files_to_temp_dir(form_data: FormData, temp_dir: str):
-    """
-    Saves all uploaded files from a form to a temporary directory.
-    Uses the form field's key as the filename.
-    """
-
-    async def save_file(key: str, file: UploadFile):
-        # Use the key from the form field as the filename
-        file_path = os.path.join(temp_dir, key)
-        async with aiofiles.open(file_path, "wb") as f:
-            await f.write(await file.read())
-
-    # Create a list of tasks to run concurrently
-    tasks = []
-    for key, value in form_data.items():
-        if isinstance(value, UploadFile):
-            tasks.append(save_file(key, value))
-
-    await asyncio.gather(*tasks)
-
-
 def read_question_from_file(temp_dir: str, filename: str = "questions.txt") -> str:
     question_path = os.path.join(temp_dir, filename)
     if not os.path.exists(question_path):
@@ -83,86 +263,538 @@ def read_question_from_file(temp_dir: str, filename: str = "questions.txt") -> s
         return f.read()
 
 
-@app.post("/api/v1/query")
-async def process_query(
-    req: Request, llm_client: Annotated[LLMClient, Depends(get_llm_client)]
-) -> Any:
-    if not req.headers.get("content-type", "").startswith("multipart/form-data"):
-        raise HTTPException(
-            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
-            detail="Unsupported media type. Please use multipart/form-data.",
-        )
+def new_sandbox(temp_dir: str, venv_path: str) -> UVCodeInterpreter:
+    return UVCodeInterpreter(
+        temp_dir=temp_dir,
+        timeout=settings.code_exec_timeout,
+        venv_path=venv_path,
+        package_cache=app_state["package_cache"],
+        max_result_bytes=settings.max_result_bytes,
+        limits=app_state["sandbox_limits"],
+        admission=app_state["admission"],
+        cgroup_root=settings.sandbox_cgroup_root,
+        forkserver=app_state["forkserver"],
+    )
 
-    form = await req.form()
 
-    uploaded_files = [v for v in form.values() if isinstance(v, UploadFile)]
+async def add_candidate_sandbox(
+    stack: AsyncExitStack, temp_dir: str
+) -> UVCodeInterpreter:
+    """
+    An extra sandbox for speculative candidates, with its own venv, kernel and
+    working directory holding copies of the uploaded files.
+    """
+    venv_pool: VenvPool = app_state["venv_pool"]
+    work_dir = mkdtemp(prefix="tds-candidate-")
+    stack.callback(shutil.rmtree, work_dir, ignore_errors=True)
+    await asyncio.to_thread(copy_inputs, temp_dir, work_dir)
+    venv_path = await venv_pool.acquire()
+    sbx = new_sandbox(work_dir, venv_path)
+    stack.callback(lambda: venv_pool.release(venv_path, dirty=sbx.dirty))
+    return await stack.enter_async_context(sbx)
+
+
+async def generate(llm_client: LLMClient, prompt: str) -> List[GeneratedCode]:
+    with phase("llm"):
+        if settings.speculative_candidates > 1:
+            return await llm_client.generate_candidates(
+                prompt,
+                settings.speculative_candidates,
+                settings.speculative_temperature,
+            )
+        return [await llm_client.generate_code(prompt)]
 
-    if not uploaded_files:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST, detail="No files were uploaded."
-        )
 
-    with TemporaryDirectory() as temp_dir:
-        try:
-            await save_files_to_temp_dir(form, temp_dir)
-            question = read_question_from_file(temp_dir)
+async def run_query(
+    llm_client: LLMClient, question: str, temp_dir: str
+) -> bytes:
+    """
+    Runs the generate -> execute -> refine loop and returns the final result
+    as JSON bytes. A cached plan for the same question and file schemas is
+    replayed first, without asking the LLM. With speculative candidates
+    enabled every round runs several variants at once and the first clean
+    final answer wins.
+    """
+    plan_cache: Optional[PlanCache] = app_state["plan_cache"]
+    fingerprint = None
+    if plan_cache:
+        schemas = await asyncio.to_thread(collect_schemas, temp_dir)
+        fingerprint = plan_fingerprint(question, schemas)
+
+    venv_pool: VenvPool = app_state["venv_pool"]
+    with phase("venv_setup"):
+        venv_path = await venv_pool.acquire()
+    sbx = new_sandbox(temp_dir, venv_path)
+    try:
+        async with sbx, AsyncExitStack() as stack:
+            plan = await plan_cache.get(fingerprint) if plan_cache else None
+            if plan:
+                log.info("Replaying cached plan for a matching question.")
+                stdout, stderr, result = await sbx.run(plan.code, plan.libraries)
+                increment("iterations")
+                report_progress("plan_replayed", ok=not stderr)
+                if not stderr:
+                    set_attribute("plan_replayed", True)
+                    return result or b"null"
+                plan_cache.replay_failures += 1  # type: ignore
+                await plan_cache.delete(fingerprint)  # type: ignore
+                log.warning(
+                    f"Cached plan failed, falling back to the LLM: {stderr[:500]}"
+                )
 
-            log.info(f"Processing query from questions.txt")
+            prompt = question
+            if settings.profile_uploads:
+                profiles = await sbx.profile_files(
+                    settings.profile_scan_rows, settings.profile_sample_rows
+                )
+                prompt = build_initial_prompt(
+                    question, profiles, settings.profile_max_chars
+                )
+                report_progress("profiled", files=len(profiles))
 
-            response = llm_client.generate_code(question)
-            if not response or not response.code:
+            candidates = await generate(llm_client, prompt)
+            if not candidates[0].code:
                 raise HTTPException(
                     status_code=503, detail="LLM failed to generate initial code."
                 )
 
-            with UVCodeInterpreter(
-                temp_dir=temp_dir, timeout=settings.code_exec_timeout
-            ) as sbx:
-                for i in range(settings.max_error_iterations):
-                    log.info(f"Code execution attempt #{i + 1}")
-                    stdout, stderr, result = sbx.run(response.code, response.libraries)
-                    # print("CODE", response.code)
-                    # print("STDOUT", stdout[:1000])
-                    # print("STDERR", stderr[:1000])
-                    # print("RESULT", str(result)[:1000] if result is not None else None)
-                    if not stderr and response.is_final_answer:
+            sandboxes = [sbx]
+            # Clean runs per sandbox, the cached plan replays them in order.
+            history: Dict[int, List[GeneratedCode]] = {}
+            iteration_seconds = 0.0
+            for i in range(settings.max_error_iterations):
+                # Don't start an execution that can't finish before the
+                # request deadline, the answer would be thrown away.
+                time_left = remaining()
+                needed = max(settings.min_iteration_seconds, iteration_seconds)
+                if time_left is not None and time_left < needed:
+                    log.warning(
+                        f"Stopping after {i} iterations, only {time_left:.1f}s left."
+                    )
+                    # Answered like any other missed deadline.
+                    raise asyncio.TimeoutError(
+                        "Ran out of time before producing a valid result."
+                    )
+
+                log.info(f"Code execution attempt #{i + 1}")
+                iteration_start = time.monotonic()
+                # Candidates that can't work as written go straight back to
+                # the LLM without taking a sandbox run.
+                base_site_packages = app_state["package_cache"].base_site_packages
+                checks = [
+                    validate(c, temp_dir, base_site_packages)
+                    if settings.preflight_enabled
+                    else None
+                    for c in candidates
+                ]
+                runnable = [
+                    c.model_copy(update={"libraries": check.libraries}) if check else c
+                    for c, check in zip(candidates, checks)
+                    if check is None or check.ok
+                ]
+                if not runnable:
+                    increment("iterations")
+                    increment("preflight_rejections", len(candidates))
+                    report_progress(
+                        "preflight", iteration=i + 1, errors=checks[0].diagnostics
+                    )
+                    if len(candidates) > 1:
+                        llm_client.record_reply(candidates[0])
+                    log.warning(
+                        f"Iteration #{i + 1} rejected before execution: {checks[0].diagnostics}"
+                    )
+                    feedback = checks[0].feedback()
+                else:
+                    increment("preflight_rejections", len(candidates) - len(runnable))
+                    with phase("iteration", iteration=i + 1):
+                        with phase("venv_setup"):
+                            while len(sandboxes) < len(runnable):
+                                sandboxes.append(
+                                    await add_candidate_sandbox(stack, temp_dir)
+                                )
+                        winner, failures = await first_success(sandboxes, runnable)
+                    increment("iterations")
+                    increment("candidates", len(runnable))
+                    report_progress(
+                        "iteration",
+                        iteration=i + 1,
+                        ok=winner is not None,
+                        error=failures[0].stderr.strip()[-300:] if failures else None,
+                    )
+                    if winner is not None:
                         log.info("Code execution successful with final answer.")
-                        return (
-                            json.loads(result)
-                            if isinstance(result, (str, bytearray, bytes))
-                            else result
-                        )
+                        if plan_cache and fingerprint:
+                            steps = history.get(id(sandboxes[winner.index]), [])
+                            await plan_cache.set(
+                                fingerprint,
+                                session_plan(steps + [runnable[winner.index]]),
+                            )
+                        return winner.result or b"null"
+                    for outcome in failures:
+                        if not outcome.stderr:
+                            history.setdefault(id(sandboxes[outcome.index]), []).append(
+                                runnable[outcome.index]
+                            )
+
+                    # Continue from whichever candidate finished first. Its
+                    # sandbox moves to the front so the refined code finds the
+                    # variables it left behind.
+                    failed = failures[0]
+                    if len(candidates) > 1:
+                        llm_client.record_reply(runnable[failed.index])
+                        sandboxes.insert(0, sandboxes.pop(failed.index))
+                    log.warning(
+                        f"Iteration #{i + 1} failed or requires refinement. Error: {failed.stderr[:500]}"
+                    )
+                    feedback = build_feedback(
+                        failed.stdout, failed.stderr, settings.feedback_max_chars
+                    )
+                candidates = await generate(llm_client, feedback)
+                iteration_seconds = time.monotonic() - iteration_start
+
+                if not candidates[0].code:
+                    raise HTTPException(
+                        status_code=503, detail="LLM failed to refine code."
+                    )
+    finally:
+        venv_pool.release(venv_path, dirty=sbx.dirty)
+
+    log.error("Failed to get a valid result after max iterations.")
+    raise HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        detail="Could not produce a valid result after maximum error iterations.",
+    )
+
 
+async def run_split_query(
+    llm_client: LLMClient, plan: QuestionPlan, temp_dir: str
+) -> bytes:
+    """
+    Solves each task of a split question set as its own query, concurrently
+    and in separate working directories. A task that fails is retried from
+    scratch, one that still fails is answered with null so the other answers
+    are still returned, but such a partial result is not cached.
+    """
+    limiter = asyncio.Semaphore(settings.planner_max_parallel)
+
+    async def solve(task: SubTask) -> Optional[bytes]:
+        async with limiter:
+            for attempt in range(settings.planner_task_retries + 1):
+                work_dir = mkdtemp(prefix="tds-task-")
+                try:
+                    await asyncio.to_thread(copy_inputs, temp_dir, work_dir)
+                    with phase("task", task=task.number, attempt=attempt + 1):
+                        result = await run_query(
+                            llm_client.fork(), plan.task_prompt(task), work_dir
+                        )
+                    report_progress("task_done", task=task.number)
+                    return result
+                except Exception as e:
+                    detail = e.detail if isinstance(e, HTTPException) else repr(e)
                     log.warning(
-                        f"Iteration #{i + 1} failed or requires refinement. Error: {stderr[:500]}"
+                        f"Task #{task.number} failed on attempt {attempt + 1}: {detail}"
                     )
-                    feedback = stderr if stderr else stdout
-                    response = llm_client.generate_code(feedback)
+                    time_left = remaining()
+                    needed = settings.min_iteration_seconds
+                    if time_left is not None and time_left < needed:
+                        break
+                finally:
+                    await asyncio.to_thread(shutil.rmtree, work_dir, True)
+        increment("failed_tasks")
+        report_progress("task_failed", task=task.number)
+        return None
+
+    results = await asyncio.gather(*(solve(task) for task in plan.tasks))
+    failed = [task.number for task, result in zip(plan.tasks, results) if not result]
+    if len(failed) == len(plan.tasks):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Could not produce a valid result for any of the questions.",
+        )
+    if failed:
+        log.warning(
+            f"Tasks {', '.join(f'#{n}' for n in failed)} failed, answering them "
+            "with null and not caching the result."
+        )
+        return UncachedResult(plan.assemble(results))
+    return plan.assemble(results)
 
-                    if not response or not response.code:
-                        raise HTTPException(
-                            status_code=503, detail="LLM failed to refine code."
+
+async def answer_query(
+    llm_client: LLMClient,
+    question: str,
+    temp_dir: str,
+    uploaded_files: Dict[str, UploadedFile],
+) -> bytes:
+    """
+    Answers a saved upload, going through the result cache when it is on.
+    Takes ownership of `temp_dir` and removes it when the computation ends,
+    which for a deduplicated query can be after the caller stopped waiting.
+    """
+
+    handed_over = False
+
+    async def compute() -> bytes:
+        nonlocal handed_over
+        handed_over = True
+        try:
+            # Bounds how many queries run LLM calls and sandboxes at once,
+            # the rest wait here without blocking the event loop.
+            async with app_state["query_limiter"]:
+                sizes = {name: upload.size for name, upload in uploaded_files.items()}
+                if settings.columnar_enabled and needs_conversion(
+                    sizes, settings.columnar_min_bytes
+                ):
+                    with phase("ingest"):
+                        converted = await convert_uploads(
+                            temp_dir,
+                            app_state["package_cache"],
+                            settings.columnar_min_bytes,
+                            clamp(settings.columnar_timeout),
+                            settings.sandbox_memory_bytes,
                         )
+                    report_progress(
+                        "ingested",
+                        files=sum("arrow" in info for info in converted.values()),
+                    )
+                plan = split_questions(question) if settings.planner_enabled else None
+                if plan:
+                    log.info(f"Split the questions into {len(plan.tasks)} tasks.")
+                    set_attribute("tasks", len(plan.tasks))
+                    report_progress("planned", tasks=len(plan.tasks))
+                    payload = await run_split_query(llm_client, plan, temp_dir)
+                else:
+                    payload = await run_query(llm_client, question, temp_dir)
+            budget = parse_byte_budget(question) or settings.image_max_bytes
+            if app_state["image_pool"] and budget:
+                with phase("images"):
+                    shrunk = await shrink_result_images(
+                        payload,
+                        budget,
+                        "webp" in question.lower(),
+                        app_state["image_pool"],
+                    )
+                if isinstance(payload, UncachedResult):
+                    shrunk = UncachedResult(shrunk)
+                payload = shrunk
+            return payload
+        finally:
+            await asyncio.to_thread(shutil.rmtree, temp_dir, True)
+
+    result_cache: Optional[ResultCache] = app_state["result_cache"]
+    try:
+        if not result_cache:
+            return await compute()
+        file_hashes = {
+            name: upload.sha256
+            for name, upload in uploaded_files.items()
+            if name != "questions.txt"
+        }
+        key = result_cache_key(question, file_hashes)
+        return await result_cache.get_or_compute(key, compute)
+    finally:
+        # A cache hit or a shared computation never ran ours.
+        if not handed_over:
+            await asyncio.to_thread(shutil.rmtree, temp_dir, True)
+
+
+async def receive_upload(req: Request) -> Tuple[str, str, Dict[str, UploadedFile]]:
+    """
+    Streams a multipart request into a new temp dir and reads its question.
+    The caller owns the returned directory.
+    """
+    if not req.headers.get("content-type", "").startswith("multipart/form-data"):
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail="Unsupported media type. Please use multipart/form-data.",
+        )
 
-            log.error("Failed to get a valid result after max iterations.")
+    temp_dir = mkdtemp()
+    try:
+        uploaded_files = await save_files_to_temp_dir(
+            req,
+            temp_dir,
+            settings.max_upload_file_bytes,
+            settings.max_upload_request_bytes,
+        )
+        if not uploaded_files:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Could not produce a valid result after maximum error iterations.",
+                detail="No files were uploaded.",
             )
+        set_attribute("upload_bytes", sum(f.size for f in uploaded_files.values()))
+        question = read_question_from_file(temp_dir)
+    except BaseException:
+        await asyncio.to_thread(shutil.rmtree, temp_dir, True)
+        raise
+    return temp_dir, question, uploaded_files
 
-        except json.JSONDecodeError:
-            log.error("Failed to decode the final result from the code interpreter.")
-            raise HTTPException(
-                status_code=500, detail="Final result was not valid JSON."
-            )
-        except HTTPException as e:
-            raise e
-        except Exception as e:
-            log.exception(f"An unexpected error occurred: {e}")
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="An internal server error occurred.",
+
+@app.post("/api/v1/query")
+async def process_query(
+    req: Request, llm_client: Annotated[LLMClient, Depends(get_llm_client)]
+) -> Any:
+    try:
+        temp_dir, question, uploaded_files = await receive_upload(req)
+
+        log.info(f"Processing query from questions.txt")
+
+        try:
+            # Cancelling on the deadline kills the sandbox process group and
+            # aborts in-flight LLM calls instead of leaving them running.
+            payload = await asyncio.wait_for(
+                answer_query(llm_client, question, temp_dir, uploaded_files),
+                remaining(),
             )
+        except asyncio.TimeoutError:
+            log.error("Query stopped at the request deadline.")
+            return timeout_response(settings.response_timeout)
+        set_attribute("result_bytes", len(payload))
+        return Response(content=payload, media_type="application/json")
+
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        log.exception(f"An unexpected error occurred: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="An internal server error occurred.",
+        )
+
+
+@app.post("/api/v1/jobs", status_code=status.HTTP_202_ACCEPTED)
+async def submit_job(
+    req: Request, llm_client: Annotated[LLMClient, Depends(get_llm_client)]
+) -> Any:
+    """
+    Accepts the same upload as /api/v1/query but answers right away with a
+    job id. Poll /api/v1/jobs/{id} or stream /api/v1/jobs/{id}/events.
+    """
+    job_queue: JobQueue = app_state["job_queue"]
+    temp_dir: Optional[str] = None
+    try:
+        # Turn the request away before its upload is read and stored.
+        job_queue.check_capacity()
+        temp_dir, question, uploaded_files = await receive_upload(req)
+        job = await job_queue.submit(
+            lambda: answer_query(llm_client, question, temp_dir, uploaded_files)
+        )
+    except QueueFull as e:
+        if temp_dir:
+            await asyncio.to_thread(shutil.rmtree, temp_dir, True)
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"Too many queued jobs, try again later. {e}",
+        )
+    return {
+        "id": job.id,
+        "status": job.status,
+        "status_url": f"/api/v1/jobs/{job.id}",
+        "events_url": f"/api/v1/jobs/{job.id}/events",
+    }
+
+
+async def get_job_or_404(job_id: str) -> Job:
+    job = await app_state["job_queue"].store.get(job_id)
+    if job is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail=f"No job with id {job_id}."
+        )
+    return job
+
+
+@app.get("/api/v1/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = await get_job_or_404(job_id)
+    return Response(content=job.to_json(), media_type="application/json")
+
+
+@app.get("/api/v1/jobs/{job_id}/events")
+async def stream_job_events(job_id: str):
+    """
+    Server-sent events: one `progress` event per recorded step, then a final
+    `done` event carrying the whole job including its result.
+    """
+    await get_job_or_404(job_id)
+
+    async def events():
+        sent = 0
+        while True:
+            job = await get_job_or_404(job_id)
+            for event in job.events[sent:]:
+                yield f"event: progress\ndata: {json.dumps(event)}\n\n"
+            sent = len(job.events)
+            if job.done:
+                # SSE data can't contain raw newlines, indented results can.
+                lines = job.to_json().decode().splitlines()
+                yield "event: done\n" + "".join(f"data: {line}\n" for line in lines)
+                yield "\n"
+                return
+            await asyncio.sleep(settings.job_poll_interval)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache"},
+    )
+
+
+@app.get("/api/v1/stats")
+async def get_stats():
+    return {
+        "venv_pool": app_state["venv_pool"].stats(),
+        "forkserver": (
+            app_state["forkserver"].stats() if app_state["forkserver"] else None
+        ),
+        "admission": app_state["admission"].stats(),
+        "jobs": await app_state["job_queue"].stats(),
+        "package_cache": app_state["package_cache"].stats(),
+        "result_cache": (
+            await app_state["result_cache"].stats()
+            if app_state["result_cache"]
+            else None
+        ),
+        "plan_cache": (
+            await app_state["plan_cache"].stats() if app_state["plan_cache"] else None
+        ),
+    }
+
+
+@app.get("/api/v1/ready")
+async def get_ready(response: Response):
+    """
+    Startup readiness: 200 once the provider SDK is loaded, the base package
+    environment and forkserver have finished starting (even if they failed,
+    the server then works without them) and the venv pool has warmed up.
+    It stays ready after that, load doesn't take it out of rotation. A failed
+    SDK import keeps it unready, `errors` says why.
+    """
+    tasks: Dict[str, asyncio.Task] = app_state["startup_tasks"]
+    checks = {name: task.done() for name, task in tasks.items()}
+    errors = {name: _startup_error(task) for name, task in tasks.items()}
+    errors = {name: error for name, error in errors.items() if error}
+    checks["provider_sdk"] = checks["provider_sdk"] and "provider_sdk" not in errors
+    pool = app_state["venv_pool"].stats()
+    checks["venv_pool"] = pool["ready"] + pool["in_use"] > 0
+    if "ready_after" not in app_state and all(checks.values()):
+        app_state["ready_after"] = time.monotonic() - app_state["started_at"]
+        log.info(f"Ready {app_state['ready_after']:.2f}s after startup.")
+    ready = "ready_after" in app_state
+    response.status_code = 200 if ready else status.HTTP_503_SERVICE_UNAVAILABLE
+    return {
+        "ready": ready,
+        "ready_after_seconds": app_state.get("ready_after"),
+        "uptime_seconds": round(time.monotonic() - app_state["started_at"], 3),
+        "checks": checks,
+        "errors": errors,
+        "base_packages": app_state["package_cache"].base_ready,
+        "forkserver": app_state["forkserver"] is not None,
+    }
+
+
+@app.get("/metrics")
+async def get_metrics():
+    return Response(content=render_latest(), media_type=CONTENT_TYPE_LATEST)
 
 
 @app.get("/api/v1/timeout")
@@ -0,0 +1,39 @@
+import asyncio
+from typing import List
+
+from schemas import GeneratedCode
+
+
+class ReplayLLMClient:
+    """
+    Stand-in for `services.LLMClient` that replays a recorded sequence of
+    responses instead of calling a provider. Once the sequence runs out the
+    last response is repeated, so a failing final script still terminates
+    through `max_error_iterations` like a real run would.
+    """
+
+    def __init__(self, responses: List[GeneratedCode], latency: float = 0.0):
+        if not responses:
+            raise ValueError("ReplayLLMClient needs at least one response.")
+        self.responses = responses
+        self.latency = latency
+        self.prompts: List[str] = []
+
+    def fork(self) -> "ReplayLLMClient":
+        # Sub-tasks replay the same recording, each from the start.
+        return ReplayLLMClient(self.responses, self.latency)
+
+    async def generate_code(self, prompt: str) -> GeneratedCode:
+        self.prompts.append(prompt)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        index = min(len(self.prompts) - 1, len(self.responses) - 1)
+        return self.responses[index]
+
+    async def generate_candidates(
+        self, prompt: str, n: int, temperature: float = 0
+    ) -> List[GeneratedCode]:
+        return [await self.generate_code(prompt)] * n
+
+    def record_reply(self, reply: GeneratedCode):
+        pass
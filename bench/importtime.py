@@ -0,0 +1,94 @@
+"""
+Import-time profile of the server modules, from `python -X importtime`.
+
+    python -m bench.importtime                 # import app
+    python -m bench.importtime --module services --top 15
+    python -m bench.importtime --max-ms 800    # exit 1 if slower
+
+Each run imports the module in a fresh interpreter (from a temporary working
+directory, so logging setup doesn't write into the repo) and reports the
+total, the slowest top-level packages by cumulative time and whether the
+provider SDKs were pulled in. Times are the median of --runs runs.
+"""
+
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LINE_RE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|(\s+)(\S+)$")
+SDKS = ("google.genai", "openai")
+
+
+def profile(module: str) -> Tuple[int, Dict[str, int], List[str]]:
+    """Total µs, cumulative µs per top-level package and all imported names."""
+    env = dict(os.environ, PYTHONPATH=REPO_ROOT)
+    with tempfile.TemporaryDirectory() as cwd:
+        completed = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            capture_output=True,
+            text=True,
+            env=env,
+            cwd=cwd,
+        )
+    if completed.returncode != 0:
+        raise SystemExit(completed.stderr[-2000:])
+    total = 0
+    packages: Dict[str, int] = defaultdict(int)
+    names = []
+    for line in completed.stderr.splitlines():
+        match = LINE_RE.match(line)
+        if not match:
+            continue
+        _, cumulative, indent, name = match.groups()
+        names.append(name)
+        # One space of indent marks a module imported directly by the script.
+        if len(indent) == 1:
+            total += int(cumulative)
+        top = name.split(".")[0]
+        if top != module:
+            # The outermost import of a package carries the largest time.
+            packages[top] = max(packages[top], int(cumulative))
+    return total, packages, names
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--module", default="app")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--max-ms", type=float, help="Fail above this median.")
+    args = parser.parse_args()
+
+    totals = []
+    packages: Dict[str, List[int]] = defaultdict(list)
+    for _ in range(args.runs):
+        total, run_packages, names = profile(args.module)
+        totals.append(total)
+        for name, cumulative in run_packages.items():
+            packages[name].append(cumulative)
+
+    median_ms = statistics.median(totals) / 1000
+    print(f"import {args.module}: {median_ms:.1f}ms (median of {args.runs})")
+    slowest = sorted(
+        ((statistics.median(times) / 1000, name) for name, times in packages.items()),
+        reverse=True,
+    )
+    for ms, name in slowest[: args.top]:
+        print(f"  {name:<24}{ms:>9.1f}ms")
+    loaded = [sdk for sdk in SDKS if sdk in names]
+    print(f"provider SDKs imported: {', '.join(loaded) or 'none'}")
+
+    if args.max_ms is not None and median_ms > args.max_ms:
+        print(f"Slower than --max-ms {args.max_ms:.0f}ms.")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""
+Builds a small hive-partitioned Parquet tree shaped like the Indian high
+court metadata set (metadata/parquet/year=*/court=*/bench=*/metadata.parquet)
+and checks the sandbox's DuckDB helper against it.
+
+    python -m bench.partitioned_parquet /tmp/courts --check
+
+--check runs sandbox_runtime/sql.py over the tree with the default sandbox
+limits, checks that DuckDB's memory_limit is sized to them and compares its
+counts with a plain pyarrow scan, then prints the plan of a
+partition-filtered query so the pruning can be seen. Needs pyarrow and
+duckdb locally.
+"""
+
+import argparse
+import datetime
+import os
+import random
+import re
+import sys
+import time
+from tempfile import gettempdir
+
+DEFAULT_ROOT = os.path.join(gettempdir(), "tds-bench-courts")
+DISPOSALS = ["DISMISSED", "ALLOWED", "DISPOSED OFF", "WITHDRAWN", "TRANSFERRED"]
+_SIZE_UNITS = {"B": 1, "KB": 1000, "MB": 1000**2, "GB": 1000**3, "TB": 1000**4}
+_SIZE_UNITS.update(KiB=1024, MiB=1024**2, GiB=1024**3, TiB=1024**4)
+
+
+def build_tree(
+    root: str,
+    years: int = 6,
+    courts: int = 5,
+    benches: int = 2,
+    rows: int = 2_000,
+    seed: int = 7,
+) -> int:
+    """Writes the tree under `root` unless it's already there, returns files."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    base = os.path.join(root, "metadata", "parquet")
+    marker = os.path.join(root, f".complete-{years}-{courts}-{benches}-{rows}")
+    if os.path.exists(marker):
+        return years * courts * benches
+    rng = random.Random(seed)
+    files = 0
+    for year in range(2019, 2019 + years):
+        for court in range(courts):
+            court_code = f"{court + 1}~{court + 10}"
+            for bench in range(benches):
+                directory = os.path.join(
+                    base, f"year={year}", f"court={court_code}", f"bench=b{bench}"
+                )
+                os.makedirs(directory, exist_ok=True)
+                registered = [
+                    datetime.date(year, 1, 1)
+                    + datetime.timedelta(days=rng.randint(0, 364))
+                    for _ in range(rows)
+                ]
+                decided = [
+                    date + datetime.timedelta(days=rng.randint(0, 900))
+                    for date in registered
+                ]
+                table = pa.table(
+                    {
+                        "court_code": [court_code] * rows,
+                        "title": [f"CRL MP/{i}/{year}" for i in range(rows)],
+                        "judge": [f"JUSTICE {rng.randint(1, 40)}" for _ in range(rows)],
+                        "cnr": [f"HC{court:02d}{year}{i:08d}" for i in range(rows)],
+                        "date_of_registration": [
+                            date.strftime("%d-%m-%Y") for date in registered
+                        ],
+                        "decision_date": decided,
+                        "disposal_nature": [rng.choice(DISPOSALS) for _ in range(rows)],
+                    }
+                )
+                path = os.path.join(directory, "metadata.parquet")
+                pq.write_table(table, path, row_group_size=500)
+                files += 1
+    open(marker, "w").close()
+    return files
+
+
+def _parse_size(text: str) -> float:
+    number, unit = re.match(r"([\d.]+)\s*(\w+)", text).groups()  # type: ignore
+    return float(number) * _SIZE_UNITS[unit]
+
+
+def check(root: str):
+    import pyarrow.dataset as ds
+
+    from limits import SandboxLimits
+
+    # What a kernel sees, sql.py reads its limits from the environment.
+    limits = SandboxLimits()
+    os.environ.update(limits.kernel_env())
+    sys.path.insert(
+        0, os.path.join(os.path.dirname(os.path.dirname(__file__)), "sandbox_runtime")
+    )
+    import sql
+
+    memory_limit = sql.scalar("SELECT current_setting('memory_limit')")
+    expected_limit = limits.memory_bytes * sql.MEMORY_FRACTION
+    print(f"memory_limit: {memory_limit} (at most {expected_limit / 1024**3:.2f} GiB)")
+    assert _parse_size(memory_limit) <= expected_limit * 1.01
+
+    pattern = os.path.join(root, "metadata/parquet/year=*/court=*/bench=*/*.parquet")
+    cases = sql.parquet(pattern)
+    expected = ds.dataset(
+        os.path.join(root, "metadata", "parquet"), partitioning="hive"
+    ).count_rows()
+
+    start = time.perf_counter()
+    total = sql.scalar(f"SELECT COUNT(*) FROM {cases}")
+    print(f"all rows: {total} (pyarrow: {expected}) {time.perf_counter() - start:.3f}s")
+    assert total == expected
+
+    filtered = f"SELECT COUNT(*) FROM {cases} WHERE year = 2020 AND court = '1~10'"
+    start = time.perf_counter()
+    count = sql.scalar(filtered)
+    print(f"year=2020, court=1~10: {count} rows {time.perf_counter() - start:.3f}s")
+    print(sql.explain(filtered))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("root", nargs="?", default=DEFAULT_ROOT)
+    parser.add_argument("--years", type=int, default=6)
+    parser.add_argument("--courts", type=int, default=5)
+    parser.add_argument("--benches", type=int, default=2)
+    parser.add_argument("--rows", type=int, default=2_000)
+    parser.add_argument("--check", action="store_true")
+    args = parser.parse_args()
+    files = build_tree(args.root, args.years, args.courts, args.benches, args.rows)
+    print(f"{files} Parquet files under {args.root}")
+    if args.check:
+        check(args.root)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""
+End-to-end benchmark for /api/v1/query with a replaying LLM stand-in.
+
+    python -m bench.run --workload small_csv --requests 50 --concurrency 8
+
+Requests go through the real app, venv pool, package cache and sandbox
+kernels in-process through httpx.ASGITransport, only the LLM is replaced. Result and plan
+caches are disabled unless --with-caches is given, otherwise every request
+after the first would be a cache hit. The question planner is off unless
+--with-planner is given, so the workloads run as one script each.
+"""
+
+import argparse
+import asyncio
+import math
+import os
+import time
+from typing import Dict, List
+
+PHASES = ["venv_setup", "install", "execution", "llm"]
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    # Nearest-rank percentile
+    rank = math.ceil(pct / 100 * len(ordered)) - 1
+    return ordered[max(0, min(rank, len(ordered) - 1))]
+
+
+def parse_server_timing(header: str) -> Dict[str, float]:
+    phases = {}
+    for entry in header.split(","):
+        name, _, params = entry.strip().partition(";")
+        if params.startswith("dur="):
+            phases[name] = float(params[4:]) / 1000
+    return phases
+
+
+def report(
+    name: str,
+    totals: List[float],
+    phases: List[Dict[str, float]],
+    errors: int,
+    wall: float,
+    concurrency: int,
+):
+    print(f"\n{name}: {len(totals)} requests, concurrency {concurrency}, {errors} errors")
+    print(f"throughput: {len(totals) / wall:.2f} req/s over {wall:.2f}s")
+    print(f"{'phase':<12}{'p50':>12}{'p95':>12}{'p99':>12}")
+    rows = [("total", totals)]
+    for phase_name in PHASES:
+        rows.append((phase_name, [p.get(phase_name, 0.0) for p in phases]))
+    for label, values in rows:
+        cells = "".join(
+            f"{percentile(values, pct) * 1000:>10.1f}ms" for pct in (50, 95, 99)
+        )
+        print(f"{label:<12}{cells}")
+
+
+async def run_workload(args, workload) -> None:
+    import httpx
+
+    import app as app_module
+    from bench.fake_llm import ReplayLLMClient
+
+    app = app_module.app
+    app.dependency_overrides[app_module.get_llm_client] = lambda: ReplayLLMClient(
+        workload.responses, args.llm_latency
+    )
+
+    files = {"questions.txt": workload.question.encode(), **workload.files()}
+    upload = [(name, (name, content)) for name, content in files.items()]
+
+    totals: List[float] = []
+    phases: List[Dict[str, float]] = []
+    errors = 0
+    limiter = asyncio.Semaphore(args.concurrency)
+
+    async with app.router.lifespan_context(app):
+        if args.warmup:
+            await asyncio.sleep(args.warmup)
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://bench", timeout=None
+        ) as client:
+
+            async def one() -> None:
+                nonlocal errors
+                async with limiter:
+                    start = time.perf_counter()
+                    response = await client.post("/api/v1/query", files=upload)
+                    totals.append(time.perf_counter() - start)
+                    phases.append(
+                        parse_server_timing(response.headers.get("server-timing", ""))
+                    )
+                    if response.status_code != 200:
+                        errors += 1
+                        if args.verbose:
+                            print(response.status_code, response.text[:300])
+
+            wall_start = time.perf_counter()
+            await asyncio.gather(*(one() for _ in range(args.requests)))
+            wall = time.perf_counter() - wall_start
+
+    report(
+        workload.name,
+        totals,
+        phases,
+        errors,
+        wall,
+        args.concurrency,
+    )
+
+
+def main():
+    from bench.workloads import WORKLOADS, load_cases
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--workload", action="append", help="Defaults to all of them.")
+    parser.add_argument("--cases", help="JSONL file with recorded cases to add.")
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument(
+        "--llm-latency", type=float, default=0.0, help="Seconds per fake LLM call."
+    )
+    parser.add_argument(
+        "--warmup", type=float, default=0.0, help="Seconds to let pools fill first."
+    )
+    parser.add_argument("--with-caches", action="store_true")
+    parser.add_argument("--with-planner", action="store_true")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    if not args.with_caches:
+        os.environ["RESULT_CACHE_ENABLED"] = "false"
+        os.environ["PLAN_CACHE_ENABLED"] = "false"
+    os.environ["PLANNER_ENABLED"] = "true" if args.with_planner else "false"
+
+    workloads = dict(WORKLOADS)
+    if args.cases:
+        workloads.update(load_cases(args.cases))
+    for name in args.workload or list(workloads):
+        asyncio.run(run_workload(args, workloads[name]))
+
+
+if __name__ == "__main__":
+    main()
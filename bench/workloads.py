@@ -0,0 +1,210 @@
+import json
+import random
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List
+
+from bench.partitioned_parquet import DEFAULT_ROOT, build_tree
+from schemas import GeneratedCode
+
+
+@dataclass
+class Workload:
+    name: str
+    question: str
+    # Built lazily, the large CSV is tens of MB.
+    files: Callable[[], Dict[str, bytes]]
+    responses: List[GeneratedCode] = field(default_factory=list)
+
+
+def _sales_csv(rows: int, seed: int = 7) -> bytes:
+    rng = random.Random(seed)
+    regions = ["north", "south", "east", "west"]
+    lines = ["order_id,region,units,price,date"]
+    for i in range(rows):
+        lines.append(
+            f"{i},{rng.choice(regions)},{rng.randint(1, 50)},"
+            f"{rng.uniform(1, 500):.2f},2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"
+        )
+    return ("\n".join(lines) + "\n").encode()
+
+
+def _edges_csv() -> bytes:
+    edges = [
+        ("Alice", "Bob"),
+        ("Alice", "Carol"),
+        ("Bob", "Carol"),
+        ("Bob", "David"),
+        ("Bob", "Eve"),
+        ("Carol", "David"),
+        ("David", "Eve"),
+    ]
+    return ("source,target\n" + "".join(f"{a},{b}\n" for a, b in edges)).encode()
+
+
+_METADATA = GeneratedCode(
+    libraries=["pandas"],
+    code=(
+        "import pandas as pd\ndf = pd.read_csv('sales.csv')\ndf.info()\n"
+        "print(df.head().to_json(orient='split'))"
+    ),
+    is_final_answer=False,
+)
+
+_SALES_FINAL = GeneratedCode(
+    libraries=["pandas"],
+    code=(
+        "import json\nimport pandas as pd\n"
+        "df = pd.read_csv('sales.csv')\n"
+        "df['revenue'] = df['units'] * df['price']\n"
+        "by_region = df.groupby('region')['revenue'].sum()\n"
+        "result = json.dumps([int(len(df)), "
+        "float(round(df['revenue'].sum(), 2)), by_region.idxmax()])"
+    ),
+    is_final_answer=True,
+)
+
+_SALES_QUESTION = """Use `sales.csv`.
+
+Return a JSON array with:
+1. How many orders are there?
+2. What is the total revenue (units * price)?
+3. Which region has the highest revenue?
+"""
+
+_NETWORK_FINAL = GeneratedCode(
+    libraries=["pandas", "networkx", "matplotlib"],
+    code=(
+        "import base64, io, json\nimport pandas as pd\nimport networkx as nx\n"
+        "import matplotlib.pyplot as plt\n"
+        "df = pd.read_csv('edges.csv')\n"
+        "G = nx.from_pandas_edgelist(df, 'source', 'target')\n"
+        "degrees = dict(G.degree())\n"
+        "fig = plt.figure(figsize=(6, 6))\n"
+        "nx.draw(G, with_labels=True)\n"
+        "buf = io.BytesIO()\nfig.savefig(buf, format='png')\nplt.close(fig)\n"
+        "result = json.dumps({'edge_count': G.number_of_edges(), "
+        "'highest_degree_node': max(degrees, key=degrees.get), "
+        "'density': nx.density(G), "
+        "'shortest_path_alice_eve': nx.shortest_path_length(G, 'Alice', 'Eve'), "
+        "'network_graph': base64.b64encode(buf.getvalue()).decode()})"
+    ),
+    is_final_answer=True,
+)
+
+_PLOT_FINAL = GeneratedCode(
+    libraries=["pandas", "matplotlib", "numpy"],
+    code=(
+        "import base64, io, json\nimport numpy as np\nimport pandas as pd\n"
+        "import matplotlib.pyplot as plt\n"
+        "df = pd.read_csv('sales.csv')\n"
+        "fig, ax = plt.subplots(figsize=(6, 4))\n"
+        "ax.scatter(df['units'], df['price'], s=4)\n"
+        "m, b = np.polyfit(df['units'], df['price'], 1)\n"
+        "ax.plot(df['units'], m * df['units'] + b, 'r:')\n"
+        "buf = io.BytesIO()\nfig.savefig(buf, format='png', dpi=80)\nplt.close(fig)\n"
+        "result = json.dumps([float(df['units'].corr(df['price'])), "
+        "'data:image/png;base64,' + base64.b64encode(buf.getvalue()).decode()])"
+    ),
+    is_final_answer=True,
+)
+
+_COURTS_QUESTION = f"""The court judgement metadata is a hive-partitioned Parquet
+dataset at `{DEFAULT_ROOT}/metadata/parquet/year=*/court=*/bench=*/metadata.parquet`
+with columns court_code, title, judge, cnr, date_of_registration,
+decision_date and disposal_nature.
+
+Return a JSON object with:
+- `total`: number of judgements in the dataset
+- `top_court_2021`: the court that disposed the most cases in 2021
+- `dismissed_share`: fraction of all judgements that were DISMISSED
+"""
+
+_COURTS_FINAL = GeneratedCode(
+    libraries=["duckdb"],
+    code=(
+        "import json\nimport sql\n"
+        f"cases = sql.parquet('{DEFAULT_ROOT}/metadata/parquet/"
+        "year=*/court=*/bench=*/metadata.parquet')\n"
+        "total = sql.scalar(f'SELECT COUNT(*) FROM {cases}')\n"
+        "top = sql.scalar(f'SELECT court FROM {cases} WHERE year = 2021 "
+        "GROUP BY court ORDER BY COUNT(*) DESC, court LIMIT 1')\n"
+        "share = sql.scalar(f\"SELECT AVG((disposal_nature = 'DISMISSED')::INT) "
+        "FROM {cases}\")\n"
+        "result = json.dumps({'total': total, 'top_court_2021': top, "
+        "'dismissed_share': round(share, 4)})"
+    ),
+    is_final_answer=True,
+)
+
+
+def _courts_files() -> Dict[str, bytes]:
+    # The dataset is read in place like a mounted volume, nothing is uploaded.
+    build_tree(DEFAULT_ROOT)
+    return {}
+
+
+WORKLOADS: Dict[str, Workload] = {
+    "small_csv": Workload(
+        "small_csv",
+        _SALES_QUESTION,
+        lambda: {"sales.csv": _sales_csv(1_000)},
+        [_METADATA, _SALES_FINAL],
+    ),
+    "large_csv": Workload(
+        "large_csv",
+        _SALES_QUESTION,
+        lambda: {"sales.csv": _sales_csv(1_000_000)},
+        [_METADATA, _SALES_FINAL],
+    ),
+    "network": Workload(
+        "network",
+        "Use the undirected network in `edges.csv`. Return a JSON object with "
+        "edge_count, highest_degree_node, density, shortest_path_alice_eve and "
+        "network_graph (base64 PNG).",
+        lambda: {"edges.csv": _edges_csv()},
+        [_NETWORK_FINAL],
+    ),
+    "plotting": Workload(
+        "plotting",
+        "Use `sales.csv`. 1. What's the correlation between units and price? "
+        "2. Draw a scatterplot of units and price with a dotted red regression "
+        "line, as a base64 PNG data URI.",
+        lambda: {"sales.csv": _sales_csv(5_000)},
+        [_PLOT_FINAL],
+    ),
+    "partitioned_parquet": Workload(
+        "partitioned_parquet",
+        _COURTS_QUESTION,
+        _courts_files,
+        [_COURTS_FINAL],
+    ),
+}
+
+
+def load_cases(path: str) -> Dict[str, Workload]:
+    """
+    Loads recorded cases from a JSONL file, one object per line:
+    {"name": ..., "question": ..., "files": {"edges.csv": "path/on/disk"},
+     "responses": [<GeneratedCode>, ...]}
+    """
+    workloads = {}
+    with open(path, "r") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            case = json.loads(line)
+
+            def read_files(files=case.get("files", {})) -> Dict[str, bytes]:
+                contents = {}
+                for name, file_path in files.items():
+                    with open(file_path, "rb") as data:
+                        contents[name] = data.read()
+                return contents
+
+            workloads[case["name"]] = Workload(
+                case["name"],
+                case["question"],
+                read_files,
+                [GeneratedCode.model_validate(r) for r in case["responses"]],
+            )
+    return workloads
@@ -0,0 +1,255 @@
+import asyncio
+import hashlib
+import logging
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+log = logging.getLogger(__name__)
+
+
+def connect_sqlite(path: str) -> sqlite3.Connection:
+    """
+    A connection to a SQLite file shared between server processes: WAL so
+    readers don't block the writer, and a long busy timeout for writers.
+    """
+    conn = sqlite3.connect(path, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    return conn
+
+
+def result_cache_key(question: str, file_hashes: Dict[str, str]) -> str:
+    """
+    Key for a query: the question text plus the name and content hash of every
+    uploaded file. Names are part of the key because generated code refers to
+    files by name.
+    """
+    digest = hashlib.sha256(question.encode())
+    for name in sorted(file_hashes):
+        digest.update(b"\0" + name.encode() + b"\0" + file_hashes[name].encode())
+    return digest.hexdigest()
+
+
+class UncachedResult(bytes):
+    """A result that is returned to the caller but never stored."""
+
+
+class CacheBackend:
+    """Stores serialized results by key. Subclasses decide where they live."""
+
+    name = "backend"
+
+    async def get(self, key: str) -> Optional[bytes]:
+        raise NotImplementedError
+
+    async def set(self, key: str, value: bytes):
+        raise NotImplementedError
+
+    async def delete(self, key: str):
+        raise NotImplementedError
+
+    async def stats(self) -> Dict[str, int]:
+        return {}
+
+
+class MemoryCache(CacheBackend):
+    """In-process LRU bounded by entry count and total bytes."""
+
+    name = "memory"
+
+    def __init__(self, max_entries: int, max_bytes: int, ttl: float):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[float, bytes]]" = OrderedDict()
+        self._bytes = 0
+
+    async def get(self, key: str) -> Optional[bytes]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        stored_at, value = entry
+        if time.time() - stored_at > self.ttl:
+            self._pop(key)
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value: bytes):
+        if len(value) > self.max_bytes:
+            return
+        self._pop(key)
+        self._entries[key] = (time.time(), value)
+        self._bytes += len(value)
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            self._pop(next(iter(self._entries)))
+
+    async def delete(self, key: str):
+        self._pop(key)
+
+    async def stats(self) -> Dict[str, int]:
+        return {"entries": len(self._entries), "bytes": self._bytes}
+
+    def _pop(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry:
+            self._bytes -= len(entry[1])
+
+
+class DiskCache(CacheBackend):
+    """
+    SQLite-backed store that survives restarts. Entries past the TTL are
+    ignored and the least recently used ones are deleted once the stored
+    values exceed `max_bytes`.
+    """
+
+    name = "disk"
+
+    def __init__(self, path: str, max_bytes: int, ttl: float):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with connect_sqlite(self.path) as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                "key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, "
+                "stored_at REAL NOT NULL, used_at REAL NOT NULL)"
+            )
+
+    def _get(self, key: str) -> Optional[bytes]:
+        now = time.time()
+        with connect_sqlite(self.path) as conn:
+            row = conn.execute(
+                "SELECT value FROM results WHERE key = ? AND stored_at > ?",
+                (key, now - self.ttl),
+            ).fetchone()
+            if row:
+                conn.execute("UPDATE results SET used_at = ? WHERE key = ?", (now, key))
+        return row[0] if row else None
+
+    def _set(self, key: str, value: bytes):
+        now = time.time()
+        with connect_sqlite(self.path) as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)",
+                (key, value, len(value), now, now),
+            )
+            conn.execute("DELETE FROM results WHERE stored_at <= ?", (now - self.ttl,))
+            (total,) = conn.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM results"
+            ).fetchone()
+            if total > self.max_bytes:
+                rows = conn.execute(
+                    "SELECT key, size FROM results ORDER BY used_at"
+                ).fetchall()
+                victims = []
+                for victim, size in rows:
+                    if total <= self.max_bytes:
+                        break
+                    victims.append((victim,))
+                    total -= size
+                conn.executemany("DELETE FROM results WHERE key = ?", victims)
+
+    def _delete(self, key: str):
+        with connect_sqlite(self.path) as conn:
+            conn.execute("DELETE FROM results WHERE key = ?", (key,))
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await asyncio.to_thread(self._get, key)
+
+    async def set(self, key: str, value: bytes):
+        await asyncio.to_thread(self._set, key, value)
+
+    async def delete(self, key: str):
+        await asyncio.to_thread(self._delete, key)
+
+    def _stats(self) -> Dict[str, int]:
+        with connect_sqlite(self.path) as conn:
+            entries, size = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results"
+            ).fetchone()
+        return {"entries": entries, "bytes": size}
+
+    async def stats(self) -> Dict[str, int]:
+        return await asyncio.to_thread(self._stats)
+
+
+class ResultCache:
+    """
+    Looks results up in each backend in order (fastest first) and
+    deduplicates identical queries that are already being computed.
+    """
+
+    def __init__(self, backends: List[CacheBackend]):
+        self.backends = backends
+        self.hits = 0
+        self.misses = 0
+        self.shared = 0
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._waiters: Dict[str, int] = {}
+
+    async def get(self, key: str) -> Optional[bytes]:
+        for i, backend in enumerate(self.backends):
+            value = await backend.get(key)
+            if value is not None:
+                # Promote into the faster tiers that missed.
+                for faster in self.backends[:i]:
+                    await faster.set(key, value)
+                return value
+        return None
+
+    async def set(self, key: str, value: bytes):
+        for backend in self.backends:
+            await backend.set(key, value)
+
+    async def get_or_compute(
+        self, key: str, compute: Callable[[], Awaitable[bytes]]
+    ) -> bytes:
+        value = await self.get(key)
+        if value is not None:
+            self.hits += 1
+            return value
+
+        task = self._inflight.get(key)
+        if task is None:
+            self.misses += 1
+            task = asyncio.create_task(self._compute(key, compute))
+            self._inflight[key] = task
+            self._waiters[key] = 0
+        else:
+            self.shared += 1
+            log.info("Identical query already in flight, waiting for its result.")
+
+        self._waiters[key] += 1
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            # Only abandon the computation once nobody is waiting for it.
+            if self._waiters.get(key) == 1 and not task.done():
+                task.cancel()
+            raise
+        finally:
+            if key in self._waiters:
+                self._waiters[key] -= 1
+
+    async def _compute(self, key: str, compute: Callable[[], Awaitable[bytes]]):
+        try:
+            value = await compute()
+            if not isinstance(value, UncachedResult):
+                await self.set(key, value)
+            return value
+        finally:
+            self._inflight.pop(key, None)
+            self._waiters.pop(key, None)
+
+    async def stats(self) -> Dict[str, object]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "shared": self.shared,
+            "inflight": len(self._inflight),
+            **{backend.name: await backend.stats() for backend in self.backends},
+        }
@@ -1,4 +1,6 @@
-from typing import Literal
+import os
+from tempfile import gettempdir
+from typing import List, Literal
 
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
@@ -12,10 +14,90 @@ class Settings(BaseSettings):
     digital_ocean_model_access_key: str = ""
     app_env: str = "production"
     log_level: str = "INFO"
+    log_format: Literal["text", "json"] = "text"
     max_error_iterations: int = 10
     code_exec_timeout: int = 300
     response_timeout: int = 290
+    min_iteration_seconds: float = 10
     llm_provider: Literal["openai", "gemini"] = "gemini"
+    llm_max_connections: int = 32
+    llm_keepalive_expiry: float = 300
+    llm_context_token_budget: int = 24000
+    llm_context_keep_recent: int = 4
+    feedback_max_chars: int = 6000
+    preflight_enabled: bool = True
+    speculative_candidates: int = 1
+    speculative_temperature: float = 0.7
+    planner_enabled: bool = False
+    planner_max_parallel: int = 4
+    planner_task_retries: int = 1
+    job_workers: int = 4
+    job_queue_size: int = 64
+    job_timeout: int = 900
+    job_ttl: int = 3600
+    job_max_stored: int = 1000
+    job_poll_interval: float = 0.5
+    job_store: Literal["memory", "sqlite"] = "memory"
+    job_store_path: str = os.path.join(gettempdir(), "tds-jobs.sqlite3")
+    workers: int = 1
+    max_concurrent_queries: int = 8
+    max_result_bytes: int = 32 * 1024**2
+    max_upload_file_bytes: int = 512 * 1024**2
+    max_upload_request_bytes: int = 1024**3
+    venv_pool_size: int = 4
+    venv_pool_dir: str = os.path.join(gettempdir(), "tds-venv-pool")
+    package_cache_dir: str = os.path.join(gettempdir(), "tds-package-cache")
+    package_cache_max_bytes: int = 5 * 1024**3
+    result_cache_enabled: bool = True
+    result_cache_backends: List[Literal["memory", "disk"]] = ["memory", "disk"]
+    result_cache_ttl: int = 24 * 3600
+    result_cache_max_entries: int = 512
+    result_cache_max_bytes: int = 256 * 1024**2
+    result_cache_path: str = os.path.join(gettempdir(), "tds-result-cache.sqlite3")
+    columnar_enabled: bool = True
+    columnar_min_bytes: int = 1024**2
+    columnar_timeout: int = 120
+    image_recompress_enabled: bool = True
+    # Applies when the question doesn't state a size limit, 0 leaves them alone.
+    image_max_bytes: int = 0
+    image_workers: int = 2
+    profile_uploads: bool = True
+    profile_scan_rows: int = 1000
+    profile_sample_rows: int = 5
+    profile_max_chars: int = 8000
+    plan_cache_enabled: bool = True
+    plan_cache_ttl: int = 7 * 24 * 3600
+    plan_cache_max_bytes: int = 64 * 1024**2
+    plan_cache_path: str = os.path.join(gettempdir(), "tds-plan-cache.sqlite3")
+    sandbox_memory_bytes: int = 4 * 1024**3
+    sandbox_cpu_seconds: int = 240
+    sandbox_max_processes: int = 64
+    sandbox_max_file_bytes: int = 2 * 1024**3
+    sandbox_max_output_bytes: int = 64 * 1024
+    sandbox_threads: int = 2
+    sandbox_cpus: float = 1.0
+    sandbox_cgroup_root: str = "/sys/fs/cgroup/tds-sandbox"
+    # 0 splits the host's cores evenly between the server workers.
+    max_concurrent_executions: int = 0
+    admission_min_free_memory_bytes: int = 1024**3
+    forkserver_enabled: bool = True
+    # Imported once by the forkserver, kernels forked from it share them.
+    forkserver_preload: List[str] = ["numpy", "pandas", "matplotlib.pyplot"]
+    base_packages: List[str] = [
+        "pandas",
+        "numpy",
+        "matplotlib",
+        "seaborn",
+        "scipy",
+        "scikit-learn",
+        "networkx",
+        "pyarrow",
+        "duckdb",
+        "orjson",
+        "requests",
+        "beautifulsoup4",
+        "lxml",
+    ]
 
 
 settings = Settings()
@@ -0,0 +1,164 @@
+import re
+from typing import Dict, List
+
+# Rough chars-per-token for code and English text. Good enough for budgeting
+# without pulling in a tokenizer per provider.
+CHARS_PER_TOKEN = 4
+
+_FRAME_RE = re.compile(r'^  File "(?P<file>[^"]+)", line \d+')
+_USER_FILE = "<string>"
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def truncate_middle(text: str, max_chars: int) -> str:
+    """Keeps the head and tail of `text`, dropping whole lines in between."""
+    if len(text) <= max_chars:
+        return text
+    lines = text.splitlines()
+    head: List[str] = []
+    tail: List[str] = []
+    budget = max_chars // 2
+    for line in lines:
+        if budget - len(line) - 1 < 0:
+            break
+        head.append(line)
+        budget -= len(line) + 1
+    budget = max_chars // 2
+    for line in reversed(lines[len(head) :]):
+        if budget - len(line) - 1 < 0:
+            break
+        tail.append(line)
+        budget -= len(line) + 1
+    tail.reverse()
+    if not head and not tail:
+        # A single enormous line, cut it by characters instead.
+        return text[: max_chars // 2] + "\n... [truncated] ...\n" + text[-max_chars // 2 :]
+    omitted = len(lines) - len(head) - len(tail)
+    return "\n".join(head + [f"... [{omitted} lines omitted] ..."] + tail)
+
+
+def _dedupe_lines(lines: List[str]) -> List[str]:
+    out: List[str] = []
+    repeats = 0
+    for line in lines:
+        if out and line == out[-1]:
+            repeats += 1
+            continue
+        if repeats:
+            out.append(f"[previous line repeated {repeats} more times]")
+            repeats = 0
+        out.append(line)
+    if repeats:
+        out.append(f"[previous line repeated {repeats} more times]")
+    return out
+
+
+def compact_traceback(text: str) -> str:
+    """
+    Shrinks Python tracebacks in `text` to the frames that matter: the ones
+    in the generated code (`<string>`) and the innermost library frame where
+    the error was raised. Repeated lines, e.g. from deep recursion or noisy
+    warnings, are collapsed.
+    """
+    lines = _dedupe_lines(text.splitlines())
+    out: List[str] = []
+    frames: List[List[str]] = []
+    in_traceback = False
+    for line in lines:
+        if line.startswith("Traceback (most recent call last):"):
+            in_traceback = True
+            frames = []
+            out.append(line)
+            continue
+        if in_traceback:
+            if _FRAME_RE.match(line):
+                frames.append([line])
+                continue
+            if line.startswith("    ") and frames:
+                frames[-1].append(line)
+                continue
+            # The exception line closes the traceback.
+            kept = [
+                frame
+                for i, frame in enumerate(frames)
+                if _USER_FILE in frame[0] or i == len(frames) - 1
+            ]
+            skipped = len(frames) - len(kept)
+            for frame in kept:
+                if skipped and frame is kept[-1] and _USER_FILE not in frame[0]:
+                    out.append(f"  ... {skipped} library frames omitted ...")
+                out.extend(frame)
+            in_traceback = False
+        out.append(line)
+    return "\n".join(out)
+
+
+def build_feedback(stdout: str, stderr: str, max_chars: int) -> str:
+    """The next refinement prompt: compacted stderr if there is any, else stdout."""
+    if stderr:
+        return truncate_middle(compact_traceback(stderr), max_chars)
+    return truncate_middle("\n".join(_dedupe_lines(stdout.splitlines())), max_chars)
+
+
+def _summarize(message: Dict[str, str]) -> str:
+    content = message["content"]
+    if message["role"] == "assistant":
+        return f"[earlier attempt omitted, {len(content)} chars]"
+    # For feedback the last line is usually the error itself.
+    last = next(
+        (line for line in reversed(content.splitlines()) if line.strip()), ""
+    )
+    return f"[earlier output omitted, it ended with: {last[:200]}]"
+
+
+class ConversationContext:
+    """
+    The refinement conversation as it is sent to the LLM. The first user turn
+    (question and file profiles) and the most recent `keep_recent` messages
+    are kept verbatim, older turns are replaced by one-line summaries, and
+    the oldest summaries are dropped once the estimate exceeds `token_budget`.
+    """
+
+    def __init__(self, system_prompt: str, token_budget: int, keep_recent: int = 4):
+        self.system_prompt = system_prompt
+        self.token_budget = token_budget
+        self.keep_recent = keep_recent
+        self.history: List[Dict[str, str]] = []
+
+    def add_user(self, content: str):
+        self.history.append({"role": "user", "content": content})
+
+    def add_assistant(self, content: str):
+        self.history.append({"role": "assistant", "content": content})
+
+    def replace_last_reply(self, content: str):
+        if self.history and self.history[-1]["role"] == "assistant":
+            self.history[-1] = {"role": "assistant", "content": content}
+        else:
+            self.add_assistant(content)
+
+    def messages(self) -> List[Dict[str, str]]:
+        """Messages that fit the budget, without the system prompt."""
+        if len(self.history) <= self.keep_recent + 1:
+            return list(self.history)
+        first = self.history[0]
+        recent = self.history[-self.keep_recent :]
+        older = [
+            {"role": message["role"], "content": _summarize(message)}
+            for message in self.history[1 : -self.keep_recent]
+        ]
+        budget = self.token_budget - estimate_tokens(self.system_prompt)
+        budget -= sum(estimate_tokens(m["content"]) for m in [first] + recent)
+        # Drop summaries oldest first, in user/assistant pairs so roles keep
+        # alternating.
+        while older and sum(estimate_tokens(m["content"]) for m in older) > budget:
+            older = older[2:]
+        return [first] + older + recent
+
+    def estimated_tokens(self) -> int:
+        return estimate_tokens(self.system_prompt) + sum(
+            estimate_tokens(m["content"]) for m in self.messages()
+        )
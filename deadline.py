@@ -0,0 +1,25 @@
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+# Absolute time.monotonic() by which the current request must be answered.
+# Tasks spawned while handling the request inherit it.
+_deadline: ContextVar[Optional[float]] = ContextVar("deadline", default=None)
+
+
+def set_deadline(seconds: float):
+    _deadline.set(time.monotonic() + seconds)
+
+
+def remaining() -> Optional[float]:
+    """Seconds left for the current request, None if it has no deadline."""
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return max(deadline - time.monotonic(), 0.0)
+
+
+def clamp(timeout: float) -> float:
+    """`timeout`, shortened so it doesn't run past the request deadline."""
+    left = remaining()
+    return timeout if left is None else min(timeout, left)
@@ -0,0 +1,90 @@
+"""
+Multi-process serving: gunicorn -c gunicorn.conf.py app:app
+
+Each worker is a separate uvicorn event loop with its own `app_state`.
+Everything that has to be shared across workers lives on disk instead:
+
+- the result and plan caches already use SQLite (`DiskCache`), the in-memory
+  result cache tier stays per worker as a fast first level;
+- jobs use `SqliteJobStore`, so any worker can answer status and event
+  requests for a job another worker runs;
+- Prometheus samples go to PROMETHEUS_MULTIPROC_DIR and /metrics aggregates
+  them;
+- the package cache is shared: the base build is serialised with a file
+  lock, overlays are built under a temporary name and renamed into place,
+  and eviction skips overlays that any worker's kernels hold a lock on.
+
+Heavy imports happen once in the master (`preload_app`, plus the configured
+provider's SDK in `on_starting`) and are shared copy-on-write. The master
+also builds the base package environment and a batch of venvs that workers
+claim from the pool's "prewarmed" directory.
+Each worker runs at most cores // WORKERS sandbox executions at once unless
+MAX_CONCURRENT_EXECUTIONS is set.
+"""
+
+import asyncio
+import os
+import shutil
+from tempfile import gettempdir
+
+# These have to be in the environment before config and prometheus_client are
+# imported, i.e. before the app is preloaded.
+os.environ.setdefault("JOB_STORE", "sqlite")
+_metrics_dir = os.environ.setdefault(
+    "PROMETHEUS_MULTIPROC_DIR", os.path.join(gettempdir(), "tds-prometheus")
+)
+shutil.rmtree(_metrics_dir, ignore_errors=True)
+os.makedirs(_metrics_dir, exist_ok=True)
+
+from config import settings  # noqa: E402
+
+try:
+    import uvicorn_worker  # noqa: F401
+
+    worker_class = "uvicorn_worker.UvicornWorker"
+except ImportError:
+    worker_class = "uvicorn.workers.UvicornWorker"
+
+bind = os.environ.get("BIND", "0.0.0.0:8000")
+workers = settings.workers
+preload_app = True
+# Requests answer within response_timeout, leave room before killing a worker.
+timeout = settings.response_timeout + 30
+graceful_timeout = 30
+keepalive = 5
+
+
+def on_starting(server):
+    from package_cache import PackageCache
+    from pool import prebuild_venvs, remove_stale_pools
+    from providers import load_sdk
+
+    # Imported once here and inherited by every worker, the app only imports
+    # the configured provider's SDK lazily.
+    load_sdk(settings.llm_provider)
+
+    remove_stale_pools(settings.venv_pool_dir)
+    package_cache = PackageCache(
+        settings.package_cache_dir,
+        settings.base_packages,
+        settings.package_cache_max_bytes,
+    )
+    try:
+        asyncio.run(package_cache.build_base())
+    except Exception as e:
+        server.log.warning(f"Base package environment not prebuilt: {e}")
+    try:
+        asyncio.run(
+            prebuild_venvs(
+                os.path.join(settings.venv_pool_dir, "prewarmed"),
+                settings.workers * settings.venv_pool_size,
+            )
+        )
+    except Exception as e:
+        server.log.warning(f"Venvs not prebuilt: {e}")
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
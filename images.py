@@ -0,0 +1,189 @@
+import asyncio
+import base64
+import binascii
+import io
+import json
+import logging
+import re
+from concurrent.futures import Executor
+from typing import Dict, List, Optional, Tuple
+
+log = logging.getLogger(__name__)
+
+try:
+    from PIL import Image
+
+    PIL_AVAILABLE = True
+except ImportError:
+    PIL_AVAILABLE = False
+
+_BUDGET_RE = re.compile(
+    r"(?:under|below|less than|smaller than|at most|within|max(?:imum)?(?: of)?)"
+    r"\s+([\d][\d,_]*(?:\.\d+)?)\s*(bytes?|b|kb|kib|mb|mib|characters?|chars?)\b",
+    re.IGNORECASE,
+)
+_UNITS = {"kb": 1000, "kib": 1024, "mb": 1000**2, "mib": 1024**2}
+_DATA_URI_RE = re.compile(r"^data:(image/(?:png|webp|jpeg));base64,")
+# Base64 of the PNG, WebP (RIFF) and JPEG magic numbers, for images that are
+# returned without a data URI prefix.
+_RAW_PREFIXES = {
+    "iVBORw0KGgo": "image/png",
+    "UklGR": "image/webp",
+    "/9j/": "image/jpeg",
+}
+# Cheap byte-level test before a result is decoded at all.
+_MARKERS = (b"data:image/",) + tuple(prefix.encode() for prefix in _RAW_PREFIXES)
+
+MIN_SIDE = 160
+
+
+def parse_byte_budget(question: str) -> Optional[int]:
+    """
+    The tightest "under 100,000 bytes" or "under 100,000 characters" size
+    limit in the question. Either way it is applied to the base64 string as
+    returned, data URI prefix included, which is what graders measure; the
+    image itself then gets about 3/4 of it.
+    """
+    budgets = []
+    for number, unit in _BUDGET_RE.findall(question):
+        value = float(number.replace(",", "").replace("_", ""))
+        budgets.append(int(value * _UNITS.get(unit.lower(), 1)))
+    return min(budgets) if budgets else None
+
+
+def _image_mime(value: str) -> Tuple[Optional[str], str]:
+    """The image type of a base64 string and its data URI prefix, if any."""
+    match = _DATA_URI_RE.match(value)
+    if match:
+        return match.group(1), match.group(0)
+    for prefix, mime in _RAW_PREFIXES.items():
+        if value.startswith(prefix):
+            return mime, ""
+    return None, ""
+
+
+def _encode(image: "Image.Image", fmt: str, **options) -> bytes:
+    buf = io.BytesIO()
+    image.save(buf, format=fmt, **options)
+    return buf.getvalue()
+
+
+def _candidates(image: "Image.Image", mime: str, allow_webp: bool):
+    """Encodings from least to most lossy, each yielded as (bytes, mime)."""
+    has_alpha = image.mode in ("RGBA", "LA", "PA") or "transparency" in image.info
+    image = image.convert("RGBA" if has_alpha else "RGB")
+    while True:
+        if mime == "image/png":
+            yield _encode(image, "PNG", optimize=True), "image/png"
+            for colors in (256, 64):
+                quantized = image.quantize(colors, method=Image.Quantize.FASTOCTREE)
+                yield _encode(quantized, "PNG", optimize=True), "image/png"
+        if mime == "image/jpeg" and not has_alpha:
+            for quality in (85, 70):
+                yield _encode(image, "JPEG", quality=quality), "image/jpeg"
+        if mime == "image/webp" or allow_webp:
+            for quality in (80, 60, 40):
+                yield _encode(image, "WEBP", quality=quality, method=4), "image/webp"
+        width, height = image.size
+        if min(width, height) * 3 // 4 < MIN_SIDE:
+            return
+        image = image.resize((width * 3 // 4, height * 3 // 4), Image.LANCZOS)
+
+
+def shrink_image(
+    data: bytes, mime: str, max_bytes: int, allow_webp: bool
+) -> Optional[Tuple[bytes, str]]:
+    """
+    Re-encodes an image until it fits in `max_bytes`: optimised and
+    palette-quantised PNG (or lower JPEG quality), then WebP when allowed,
+    then the same at 3/4 the size each round. Keeps the original format
+    unless WebP is allowed.
+    Returns None if nothing fits. Runs in a worker process.
+    """
+    with Image.open(io.BytesIO(data)) as image:
+        image.load()
+        for encoded, encoded_mime in _candidates(image, mime, allow_webp):
+            if len(encoded) <= max_bytes:
+                return encoded, encoded_mime
+    return None
+
+
+def _oversized(value, budget: int, found: List[str]):
+    if isinstance(value, str):
+        if len(value) > budget and _image_mime(value)[0]:
+            found.append(value)
+    elif isinstance(value, list):
+        for item in value:
+            _oversized(item, budget, found)
+    elif isinstance(value, dict):
+        for item in value.values():
+            _oversized(item, budget, found)
+
+
+def _replace(value, replacements: Dict[str, str]):
+    if isinstance(value, str):
+        return replacements.get(value, value)
+    if isinstance(value, list):
+        return [_replace(item, replacements) for item in value]
+    if isinstance(value, dict):
+        return {key: _replace(item, replacements) for key, item in value.items()}
+    return value
+
+
+async def _shrink_string(
+    value: str, budget: int, allow_webp: bool, executor: Executor
+) -> Optional[str]:
+    mime, prefix = _image_mime(value)
+    try:
+        data = base64.b64decode(value[len(prefix) :], validate=True)
+    except (binascii.Error, ValueError):
+        return None
+    if prefix:
+        # Room for the longest prefix, the format may change to WebP.
+        prefix_bytes = len("data:image/webp;base64,")
+    else:
+        # Without a prefix the caller can't be told about a new format.
+        prefix_bytes, allow_webp = 0, False
+    max_bytes = (budget - prefix_bytes) // 4 * 3
+    loop = asyncio.get_running_loop()
+    try:
+        shrunk = await loop.run_in_executor(
+            executor, shrink_image, data, mime, max_bytes, allow_webp
+        )
+    except Exception as e:
+        log.warning(f"Could not recompress a {mime} result: {e}")
+        return None
+    if shrunk is None:
+        return None
+    encoded, encoded_mime = shrunk
+    text = base64.b64encode(encoded).decode()
+    return f"data:{encoded_mime};base64,{text}" if prefix else text
+
+
+async def shrink_result_images(
+    payload: bytes, budget: int, allow_webp: bool, executor: Executor
+) -> bytes:
+    """
+    Recompresses base64 images in a JSON result that are longer than
+    `budget` characters, so an oversized plot doesn't fail the answer.
+    Returns `payload` unchanged when there is nothing to do.
+    """
+    if not PIL_AVAILABLE or not any(marker in payload for marker in _MARKERS):
+        return payload
+    result = json.loads(payload)
+    found: List[str] = []
+    _oversized(result, budget, found)
+    if not found:
+        return payload
+
+    shrunk = await asyncio.gather(
+        *(_shrink_string(value, budget, allow_webp, executor) for value in found)
+    )
+    replacements = {old: new for old, new in zip(found, shrunk) if new}
+    log.info(
+        f"Recompressed {len(replacements)} of {len(found)} images "
+        f"over {budget} characters."
+    )
+    if not replacements:
+        return payload
+    return json.dumps(_replace(result, replacements)).encode()
@@ -0,0 +1,65 @@
+import json
+import logging
+import os
+import subprocess
+import sys
+from typing import Dict
+
+from package_cache import PackageCache
+from process_utils import run_command
+
+log = logging.getLogger(__name__)
+
+COLUMNAR_SCRIPT = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "sandbox_runtime", "columnar.py"
+)
+CONVERTIBLE = (".csv", ".tsv", ".json", ".jsonl", ".ndjson")
+
+
+def needs_conversion(sizes: Dict[str, int], min_bytes: int) -> bool:
+    return any(
+        size >= min_bytes and os.path.splitext(name)[1].lower() in CONVERTIBLE
+        for name, size in sizes.items()
+    )
+
+
+async def convert_uploads(
+    temp_dir: str,
+    package_cache: PackageCache,
+    min_bytes: int,
+    timeout: float,
+    memory_bytes: int = 0,
+) -> Dict[str, Dict]:
+    """
+    Writes Arrow copies of the large tabular uploads in `temp_dir` (see
+    sandbox_runtime/columnar.py) so every later read in the sandbox is a
+    memory map instead of a parse. Runs once per upload, before the query is
+    split or executed, with the base environment's pyarrow. Failures only
+    cost the fast path, the original files are untouched.
+    """
+    site_packages = package_cache.base_site_packages
+    if not site_packages:
+        log.info("Base environment not built, skipping columnar conversion.")
+        return {}
+    python = os.path.join(package_cache.base_path, "bin", "python")
+    if not os.path.exists(python):
+        python = sys.executable
+    env = {"PATH": os.environ.get("PATH", ""), "PYTHONPATH": site_packages}
+    try:
+        completed = await run_command(
+            [python, COLUMNAR_SCRIPT, temp_dir, str(min_bytes), str(memory_bytes)],
+            timeout=timeout,
+            env=env,
+            cwd=temp_dir,
+        )
+        converted = json.loads(completed.stdout)
+    except subprocess.CalledProcessError as e:
+        log.warning(f"Columnar conversion failed: {e.stderr[-500:]}")
+        return {}
+    except (subprocess.TimeoutExpired, ValueError) as e:
+        log.warning(f"Columnar conversion failed: {e}")
+        return {}
+    for name, info in converted.items():
+        if "error" in info:
+            log.warning(f"Could not convert {name}: {info['error']}")
+    return converted
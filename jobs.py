@@ -0,0 +1,347 @@
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from collections import OrderedDict
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+from cache import connect_sqlite
+from deadline import set_deadline
+from metrics import observe_request
+from timing import start_request
+
+log = logging.getLogger(__name__)
+
+TERMINAL_STATUSES = ("succeeded", "failed")
+
+
+@dataclass
+class Job:
+    id: str
+    status: str = "queued"
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    events: List[Dict[str, Any]] = field(default_factory=list)
+    error: Optional[str] = None
+    # JSON bytes of the answer, kept out of `to_json` so it isn't re-encoded.
+    result: Optional[bytes] = None
+
+    @property
+    def done(self) -> bool:
+        return self.status in TERMINAL_STATUSES
+
+    def to_json(self, include_result: bool = True) -> bytes:
+        """The job as a JSON document, with `result` spliced in as-is."""
+        meta = asdict(self)
+        meta.pop("result")
+        body = json.dumps(meta).encode()
+        if include_result and self.result is not None:
+            body = body[:-1] + b', "result": ' + self.result + b"}"
+        return body
+
+
+class JobStore:
+    """Keeps job state. Subclasses decide where it lives."""
+
+    name = "store"
+
+    async def create(self, job: Job):
+        raise NotImplementedError
+
+    async def get(self, job_id: str) -> Optional[Job]:
+        raise NotImplementedError
+
+    async def update(self, job: Job):
+        raise NotImplementedError
+
+    async def add_event(self, job_id: str, event: Dict[str, Any]):
+        raise NotImplementedError
+
+    async def stats(self) -> Dict[str, int]:
+        return {}
+
+
+class MemoryJobStore(JobStore):
+    """
+    In-process store, the stand-in for a shared one. Finished jobs are
+    forgotten after `ttl` seconds or once more than `max_jobs` are kept.
+    """
+
+    name = "memory"
+
+    def __init__(self, max_jobs: int, ttl: float):
+        self.max_jobs = max_jobs
+        self.ttl = ttl
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+
+    async def create(self, job: Job):
+        self._prune()
+        self._jobs[job.id] = job
+
+    async def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    async def update(self, job: Job):
+        self._jobs[job.id] = job
+
+    async def add_event(self, job_id: str, event: Dict[str, Any]):
+        job = self._jobs.get(job_id)
+        if job:
+            job.events.append(event)
+
+    async def stats(self) -> Dict[str, int]:
+        return {"jobs": len(self._jobs)}
+
+    def _prune(self):
+        now = time.time()
+        for job_id, job in list(self._jobs.items()):
+            expired = job.done and now - (job.finished_at or now) > self.ttl
+            if expired or (job.done and len(self._jobs) >= self.max_jobs):
+                del self._jobs[job_id]
+
+
+class SqliteJobStore(JobStore):
+    """
+    Job state in a SQLite file, so every server process sharing the file can
+    answer status and event requests for jobs another process is running.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path: str, max_jobs: int, ttl: float):
+        self.path = path
+        self.max_jobs = max_jobs
+        self.ttl = ttl
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with connect_sqlite(self.path) as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id TEXT PRIMARY KEY, status TEXT NOT NULL, created_at REAL NOT NULL, "
+                "started_at REAL, finished_at REAL, error TEXT, result BLOB)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS job_events ("
+                "seq INTEGER PRIMARY KEY AUTOINCREMENT, job_id TEXT NOT NULL, "
+                "event TEXT NOT NULL)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS job_events_job ON job_events (job_id, seq)"
+            )
+
+    def _write(self, job: Job):
+        with connect_sqlite(self.path) as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO jobs VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    job.id,
+                    job.status,
+                    job.created_at,
+                    job.started_at,
+                    job.finished_at,
+                    job.error,
+                    job.result,
+                ),
+            )
+
+    def _create(self, job: Job):
+        now = time.time()
+        with connect_sqlite(self.path) as conn:
+            stale = conn.execute(
+                "SELECT id FROM jobs WHERE finished_at < ?", (now - self.ttl,)
+            ).fetchall()
+            (count,) = conn.execute("SELECT COUNT(*) FROM jobs").fetchone()
+            excess = count - len(stale) - self.max_jobs + 1
+            if excess > 0:
+                stale += conn.execute(
+                    "SELECT id FROM jobs WHERE finished_at >= ? "
+                    "ORDER BY finished_at LIMIT ?",
+                    (now - self.ttl, excess),
+                ).fetchall()
+            conn.executemany("DELETE FROM jobs WHERE id = ?", stale)
+            conn.executemany("DELETE FROM job_events WHERE job_id = ?", stale)
+        self._write(job)
+
+    def _get(self, job_id: str) -> Optional[Job]:
+        with connect_sqlite(self.path) as conn:
+            row = conn.execute(
+                "SELECT id, status, created_at, started_at, finished_at, error, result "
+                "FROM jobs WHERE id = ?",
+                (job_id,),
+            ).fetchone()
+            if row is None:
+                return None
+            events = conn.execute(
+                "SELECT event FROM job_events WHERE job_id = ? ORDER BY seq",
+                (job_id,),
+            ).fetchall()
+        job_id, status, created_at, started_at, finished_at, error, result = row
+        return Job(
+            id=job_id,
+            status=status,
+            created_at=created_at,
+            started_at=started_at,
+            finished_at=finished_at,
+            events=[json.loads(event) for (event,) in events],
+            error=error,
+            result=result,
+        )
+
+    def _add_event(self, job_id: str, event: Dict[str, Any]):
+        with connect_sqlite(self.path) as conn:
+            conn.execute(
+                "INSERT INTO job_events (job_id, event) VALUES (?, ?)",
+                (job_id, json.dumps(event)),
+            )
+
+    async def create(self, job: Job):
+        await asyncio.to_thread(self._create, job)
+
+    async def get(self, job_id: str) -> Optional[Job]:
+        return await asyncio.to_thread(self._get, job_id)
+
+    async def update(self, job: Job):
+        await asyncio.to_thread(self._write, job)
+
+    async def add_event(self, job_id: str, event: Dict[str, Any]):
+        await asyncio.to_thread(self._add_event, job_id, event)
+
+    async def stats(self) -> Dict[str, int]:
+        return await asyncio.to_thread(self._stats)
+
+    def _stats(self) -> Dict[str, int]:
+        with connect_sqlite(self.path) as conn:
+            (jobs,) = conn.execute("SELECT COUNT(*) FROM jobs").fetchone()
+        return {"jobs": jobs}
+
+
+class QueueFull(Exception):
+    pass
+
+
+# Set while a job runs so deep code can report progress without threading a
+# callback through every call.
+_progress: ContextVar[Optional[Callable[[str, Dict[str, Any]], None]]] = ContextVar(
+    "job_progress", default=None
+)
+
+
+def report_progress(stage: str, **data: Any):
+    """Adds a progress event to the current job, a no-op outside of jobs."""
+    callback = _progress.get()
+    if callback is not None:
+        callback(stage, data)
+
+
+class JobQueue:
+    """
+    A bounded queue of submitted work with a fixed number of worker tasks.
+    Each job runs with its own deadline and trace, like a request would.
+    """
+
+    def __init__(self, store: JobStore, workers: int, max_queued: int, timeout: float):
+        self.store = store
+        self.workers = workers
+        self.timeout = timeout
+        self._queue: "asyncio.Queue[tuple]" = asyncio.Queue(max_queued)
+        self._tasks: Set[asyncio.Task] = set()
+        # Slots held by submits that are still storing their job.
+        self._reserved = 0
+        self.running = 0
+
+    def start(self):
+        for _ in range(self.workers):
+            self._tasks.add(asyncio.create_task(self._worker()))
+
+    def check_capacity(self):
+        """Raises QueueFull if a job submitted now would be refused."""
+        queued = self._queue.qsize() + self._reserved
+        if self._queue.maxsize > 0 and queued >= self._queue.maxsize:
+            raise QueueFull(f"{queued} jobs are already queued.")
+
+    async def submit(self, work: Callable[[], Awaitable[bytes]]) -> Job:
+        job = Job(id=uuid.uuid4().hex)
+        self.check_capacity()
+        # The slot is taken before storing the job yields, so concurrent
+        # submits can't both pass the check above.
+        self._reserved += 1
+        try:
+            await self.store.create(job)
+        finally:
+            self._reserved -= 1
+        self._queue.put_nowait((job.id, work))
+        return job
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+
+    async def stats(self) -> Dict[str, object]:
+        return {
+            "queued": self._queue.qsize(),
+            "running": self.running,
+            "workers": self.workers,
+            self.store.name: await self.store.stats(),
+        }
+
+    async def _worker(self):
+        while True:
+            job_id, work = await self._queue.get()
+            self.running += 1
+            try:
+                await self._run(job_id, work)
+            except Exception as e:
+                log.exception(f"Job {job_id} could not be recorded: {e}")
+            finally:
+                self.running -= 1
+                self._queue.task_done()
+
+    async def _run(self, job_id: str, work: Callable[[], Awaitable[bytes]]):
+        job = await self.store.get(job_id)
+        if job is None:
+            return
+        trace = start_request()
+        set_deadline(self.timeout)
+        pending: List[asyncio.Task] = []
+
+        def progress(stage: str, data: Dict[str, Any]):
+            event = {"stage": stage, "at": round(time.time() - job.created_at, 3)}
+            event.update(data)
+            pending.append(asyncio.create_task(self.store.add_event(job_id, event)))
+
+        _progress.set(progress)
+        job.status, job.started_at = "running", time.time()
+        await self.store.update(job)
+        report_progress("started")
+        status_code = 200
+        try:
+            job.result = await asyncio.wait_for(work(), self.timeout)
+            job.status = "succeeded"
+        except asyncio.TimeoutError:
+            job.status, job.error = "failed", f"Timed out after {self.timeout} seconds."
+            status_code = 504
+        except Exception as e:
+            job.status = "failed"
+            job.error = getattr(e, "detail", None) or "An internal error occurred."
+            status_code = getattr(e, "status_code", 500)
+            if status_code == 500:
+                log.exception(f"Job {job_id} failed: {e}")
+        await asyncio.gather(*pending)
+        # The store may hand out copies, take the events it recorded.
+        stored = await self.store.get(job_id)
+        if stored is not None:
+            job.events = stored.events
+        job.finished_at = time.time()
+        await self.store.update(job)
+        total = time.perf_counter() - trace.start
+        observe_request(trace, "job", status_code, total)
+        log.info(
+            f"Job {job_id} {job.status} in {total:.3f}s",
+            extra={"job_id": job_id, "status": status_code, **trace.attributes},
+        )
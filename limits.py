@@ -0,0 +1,188 @@
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from dataclasses import asdict, dataclass
+from typing import Dict, Optional
+
+log = logging.getLogger(__name__)
+
+MEMINFO_PATH = "/proc/meminfo"
+
+
+@dataclass
+class SandboxLimits:
+    """
+    Per-kernel resource limits. Zero disables a limit. The kernel applies the
+    rlimits to itself on start (see sandbox_runtime/kernel.py), memory,
+    process count and CPU share are additionally enforced through a cgroup
+    when cgroup v2 is writable.
+    """
+
+    memory_bytes: int = 4 * 1024**3
+    cpu_seconds: int = 240
+    max_processes: int = 64
+    max_file_bytes: int = 2 * 1024**3
+    max_output_bytes: int = 64 * 1024
+    threads: int = 2
+    cpus: float = 1.0
+
+    def kernel_env(self) -> Dict[str, str]:
+        env = {"TDS_SANDBOX_LIMITS": json.dumps(asdict(self))}
+        if self.threads:
+            for name in (
+                "OMP_NUM_THREADS",
+                "OPENBLAS_NUM_THREADS",
+                "MKL_NUM_THREADS",
+                "NUMEXPR_MAX_THREADS",
+                "POLARS_MAX_THREADS",
+            ):
+                env[name] = str(self.threads)
+        return env
+
+
+class Cgroup:
+    """A cgroup v2 directory holding one kernel process and its children."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    @classmethod
+    def create(cls, root: str, limits: SandboxLimits) -> Optional["Cgroup"]:
+        """Returns None if cgroup v2 isn't mounted or delegated at `root`."""
+        if not root or not os.path.exists(os.path.join(root, "cgroup.procs")):
+            return None
+        path = os.path.join(root, f"kernel-{uuid.uuid4().hex[:12]}")
+        try:
+            os.mkdir(path)
+            cgroup = cls(path)
+            if limits.memory_bytes:
+                cgroup._write("memory.max", str(limits.memory_bytes))
+                cgroup._write("memory.swap.max", "0")
+            if limits.max_processes:
+                cgroup._write("pids.max", str(limits.max_processes))
+            if limits.cpus:
+                period = 100_000
+                cgroup._write("cpu.max", f"{int(limits.cpus * period)} {period}")
+            return cgroup
+        except OSError as e:
+            log.warning(f"Could not set up sandbox cgroup under {root}: {e}")
+            cls(path).remove()
+            return None
+
+    def add(self, pid: int):
+        self._write("cgroup.procs", str(pid))
+
+    def remove(self):
+        try:
+            os.rmdir(self.path)
+        except OSError:
+            pass
+
+    def _write(self, name: str, value: str):
+        try:
+            with open(os.path.join(self.path, name), "w") as f:
+                f.write(value)
+        except FileNotFoundError:
+            # Controller not enabled for this subtree, rlimits still apply.
+            log.debug(f"cgroup file {name} missing in {self.path}")
+
+
+def executions_per_worker(workers: int, cores: Optional[int] = None) -> int:
+    """
+    Sandbox executions one server process may run at once: the host's cores
+    split evenly between the worker processes, never less than one.
+    """
+    cores = cores or os.cpu_count() or 1
+    return max(1, cores // max(1, workers))
+
+
+def available_memory() -> Optional[int]:
+    try:
+        with open(MEMINFO_PATH) as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+class AdmissionController:
+    """
+    Gate in front of this process's sandbox executions. At most `max_active`
+    run at once, and new ones wait while the host has less than
+    `min_free_memory` bytes available, so a burst of queries queues instead
+    of thrashing. The memory check is host-wide, so it also holds back
+    executions when other server workers are using the memory.
+    """
+
+    def __init__(
+        self, max_active: int, min_free_memory: int, poll_interval: float = 0.5
+    ):
+        self.max_active = max_active
+        self.min_free_memory = min_free_memory
+        self.poll_interval = poll_interval
+        self._slots = asyncio.Semaphore(max_active)
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.memory_waits = 0
+        self.queued_seconds = 0.0
+
+    async def acquire(self):
+        self.waiting += 1
+        start = time.monotonic()
+        try:
+            await self._slots.acquire()
+            try:
+                await self._wait_for_memory()
+            except BaseException:
+                self._slots.release()
+                raise
+        finally:
+            self.waiting -= 1
+            self.queued_seconds += time.monotonic() - start
+        self.active += 1
+        self.admitted += 1
+
+    def release(self):
+        self.active -= 1
+        self._slots.release()
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        self.release()
+
+    async def _wait_for_memory(self):
+        if not self.min_free_memory:
+            return
+        waited = False
+        while True:
+            free = available_memory()
+            # Always let one execution through so the queue can't wedge.
+            if free is None or free >= self.min_free_memory or self.active == 0:
+                return
+            if not waited:
+                waited = True
+                self.memory_waits += 1
+                log.info(
+                    f"Only {free // 1024**2} MiB available, holding execution until memory frees up."
+                )
+            await asyncio.sleep(self.poll_interval)
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "max_active": self.max_active,
+            "active": self.active,
+            "waiting": self.waiting,
+            "admitted": self.admitted,
+            "memory_waits": self.memory_waits,
+            "queued_seconds": round(self.queued_seconds, 3),
+            "available_memory": available_memory(),
+        }
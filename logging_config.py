@@ -1,4 +1,5 @@
 # logging_config.py
+import json
 import logging
 import os
 from logging.config import dictConfig
@@ -7,6 +8,28 @@ from logging.handlers import RotatingFileHandler
 from config import settings
 
 
+# Attributes every LogRecord has, anything else was passed through `extra`.
+_RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, with any `extra` fields kept as top-level keys."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "time": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS:
+                payload[key] = value
+        if record.exc_info:
+            payload["exception"] = self.formatException(record.exc_info)
+        return json.dumps(payload, default=str)
+
+
 def setup_logging():
     # --- Create logs directory if it doesn't exist ---
     log_directory = "logs"
@@ -30,17 +53,23 @@ def setup_logging():
                 "format": "%(asctime)s - %(levelname)s - %(name)s - %(message)s",
                 "datefmt": "%Y-%m-%d %H:%M:%S",
             },
+            # Structured formatter, used for the file and optionally the console
+            "json_formatter": {"()": JsonFormatter},
         },
         "handlers": {
             # Console handler (keeps logging to the terminal)
             "console_handler": {
-                "formatter": "console_formatter",
+                "formatter": (
+                    "json_formatter"
+                    if settings.log_format == "json"
+                    else "console_formatter"
+                ),
                 "class": "logging.StreamHandler",
                 "stream": "ext://sys.stderr",
             },
             # File handler (for writing to logs/app.log)
             "file_handler": {
-                "formatter": "file_formatter",
+                "formatter": "json_formatter",
                 "class": "logging.handlers.RotatingFileHandler",
                 "filename": log_file_path,
                 "maxBytes": 10 * 1024 * 1024,  # 10 MB
@@ -0,0 +1,72 @@
+import os
+
+from prometheus_client import (  # noqa: F401
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+from timing import RequestTrace
+
+_SECONDS_BUCKETS = (0.005, 0.025, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+_BYTES_BUCKETS = tuple(4**i * 1024 for i in range(12))
+
+REQUEST_SECONDS = Histogram(
+    "tds_request_seconds",
+    "End-to-end request latency.",
+    ["route", "status"],
+    buckets=_SECONDS_BUCKETS,
+)
+PHASE_SECONDS = Histogram(
+    "tds_phase_seconds",
+    "Time spent per pipeline phase, summed over one request.",
+    ["phase"],
+    buckets=_SECONDS_BUCKETS,
+)
+ITERATIONS = Histogram(
+    "tds_refinement_iterations",
+    "Sandbox executions needed per query.",
+    buckets=(1, 2, 3, 4, 5, 7, 10, 15, 20),
+)
+UPLOAD_BYTES = Histogram(
+    "tds_upload_bytes", "Bytes uploaded per query.", buckets=_BYTES_BUCKETS
+)
+RESULT_BYTES = Histogram(
+    "tds_result_bytes", "Size of the JSON result per query.", buckets=_BYTES_BUCKETS
+)
+LLM_TOKENS = Histogram(
+    "tds_llm_tokens",
+    "Tokens per LLM call.",
+    ["kind"],
+    buckets=(100, 250, 500, 1000, 2000, 4000, 8000, 16000, 32000, 64000, 128000),
+)
+
+
+def observe_request(trace: RequestTrace, route: str, status: int, total: float):
+    REQUEST_SECONDS.labels(route, str(status)).observe(total)
+    for name, seconds in trace.phases.items():
+        PHASE_SECONDS.labels(name).observe(seconds)
+    attributes = trace.attributes
+    if "iterations" in attributes:
+        ITERATIONS.observe(attributes["iterations"])
+    if "upload_bytes" in attributes:
+        UPLOAD_BYTES.observe(attributes["upload_bytes"])
+    if "result_bytes" in attributes:
+        RESULT_BYTES.observe(attributes["result_bytes"])
+
+
+def observe_llm_call(prompt_tokens: int, completion_tokens: int):
+    LLM_TOKENS.labels("prompt").observe(prompt_tokens)
+    LLM_TOKENS.labels("completion").observe(completion_tokens)
+
+
+def render_latest() -> bytes:
+    # Under gunicorn every worker writes its samples to PROMETHEUS_MULTIPROC_DIR
+    # (see gunicorn.conf.py), a scrape aggregates them.
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest()
@@ -1,10 +1,27 @@
 import asyncio
+import logging
 import time
 
 from fastapi import FastAPI, Request, Response
 from fastapi.responses import JSONResponse
 from starlette.middleware.base import BaseHTTPMiddleware
 
+from deadline import set_deadline
+from metrics import observe_request
+from timing import start_request
+
+log = logging.getLogger(__name__)
+
+UNMATCHED_ROUTE = "<unmatched>"
+
+
+def timeout_response(timeout_seconds: float) -> JSONResponse:
+    """The response to a request past its deadline, wherever it is noticed."""
+    return JSONResponse(
+        status_code=200,
+        content={"detail": f"Request timed out after {timeout_seconds} seconds"},
+    )
+
 
 class TimeoutMiddleware(BaseHTTPMiddleware):
     def __init__(self, app, timeout_seconds=10):
@@ -12,6 +29,10 @@ class TimeoutMiddleware(BaseHTTPMiddleware):
         self.timeout_seconds = timeout_seconds
 
     async def dispatch(self, request: Request, call_next):
+        trace = start_request()
+        # The handler cancels its own sandbox and LLM work against this
+        # deadline, wait_for below only stops waiting for it.
+        set_deadline(self.timeout_seconds)
         try:
             start_time = time.time()
 
@@ -24,12 +45,26 @@ class TimeoutMiddleware(BaseHTTPMiddleware):
             process_time = time.time() - start_time
             response.headers["X-Process-Time"] = str(process_time)
 
-            return response
-
         except asyncio.TimeoutError:
-            return JSONResponse(
-                status_code=200,
-                content={
-                    "detail": f"Request timed out after {self.timeout_seconds} seconds"
-                },
-            )
+            response = timeout_response(self.timeout_seconds)
+            trace.attributes["timed_out"] = True
+
+        total = time.perf_counter() - trace.start
+        response.headers["Server-Timing"] = trace.server_timing(total)
+        # Label by route template, raw paths of unmatched requests (404s,
+        # scanners) would make the metric's label set unbounded.
+        route = request.scope.get("route")
+        route_path = getattr(route, "path", UNMATCHED_ROUTE)
+        observe_request(trace, route_path, response.status_code, total)
+        log.info(
+            f"{request.method} {request.url.path} {response.status_code} {total:.3f}s",
+            extra={
+                "route": route_path,
+                "status": response.status_code,
+                "duration_ms": round(total * 1000, 1),
+                "phases_ms": {k: round(v * 1000, 1) for k, v in trace.phases.items()},
+                "spans": trace.spans,
+                **trace.attributes,
+            },
+        )
+        return response
@@ -0,0 +1,332 @@
+import asyncio
+import fcntl
+import glob
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import sys
+import uuid
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from process_utils import pid_alive, run_command
+
+log = logging.getLogger(__name__)
+
+_SPECIFIER_RE = re.compile(r"(===|==|~=|!=|<=|>=|<|>)")
+
+
+def canonical_name(name: str) -> str:
+    # PEP 503 normalisation, so "Scikit_Learn" and "scikit-learn" hash the same
+    return re.sub(r"[-_.]+", "-", name).lower()
+
+
+def normalize_requirements(packages: List[str]) -> List[str]:
+    normalized = set()
+    for pkg in packages:
+        pkg = "".join(pkg.split())
+        if not pkg:
+            continue
+        name, *rest = _SPECIFIER_RE.split(pkg, maxsplit=1)
+        bare = name.split("[")[0]
+        if bare in sys.stdlib_module_names:
+            continue
+        extras = name[len(bare) :].lower()
+        normalized.add(canonical_name(bare) + extras + "".join(rest))
+    return sorted(normalized)
+
+
+def requirements_hash(requirements: List[str]) -> str:
+    return hashlib.sha256("\n".join(requirements).encode()).hexdigest()[:32]
+
+
+def _dir_size(path: str) -> int:
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for filename in filenames:
+            try:
+                total += os.lstat(os.path.join(dirpath, filename)).st_size
+            except OSError:
+                pass
+    return total
+
+
+class PackageCache:
+    """
+    Resolves the libraries requested by generated code to something importable
+    without reinstalling them every iteration.
+
+    A persistent base venv holds the common data-science stack. Anything it
+    doesn't cover is installed once into an overlay directory keyed by the hash
+    of the normalised requirement set, and overlays are evicted LRU once their
+    combined size exceeds `max_bytes`. uv's own cache is shared between all of
+    them, so overlay builds mostly hardlink already downloaded wheels.
+
+    Server processes can share `root`. An overlay handed out by `resolve` is
+    marked in use with a shared flock on its lock file until `release`, and
+    eviction only deletes overlays whose lock it can take exclusively.
+    """
+
+    def __init__(self, root: str, base_packages: List[str], max_bytes: int):
+        self.root = root
+        self.base_packages = normalize_requirements(base_packages)
+        self.max_bytes = max_bytes
+        self.base_path = os.path.join(root, "base")
+        self.overlays_dir = os.path.join(root, "overlays")
+        self.uv_cache_dir = os.path.join(root, "uv-cache")
+        self.locks_dir = os.path.join(root, "overlay-locks")
+        self._manifest_path = os.path.join(root, "base.json")
+        self._base_versions: Dict[str, str] = {}
+        self._overlays: "OrderedDict[str, int]" = OrderedDict()
+        self._build_locks: Dict[str, asyncio.Lock] = {}
+        # Overlays in use by this process: the shared lock's fd and a count.
+        self._held: Dict[str, List[int]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.base_hits = 0
+        os.makedirs(self.overlays_dir, exist_ok=True)
+        os.makedirs(self.locks_dir, exist_ok=True)
+        self._load_overlays()
+
+    @property
+    def base_ready(self) -> bool:
+        return bool(self._base_versions)
+
+    @property
+    def base_site_packages(self) -> Optional[str]:
+        if not self.base_ready:
+            return None
+        matches = glob.glob(
+            os.path.join(self.base_path, "lib", "python*", "site-packages")
+        )
+        return matches[0] if matches else None
+
+    def uv_env(self, **extra: str) -> Dict[str, str]:
+        env = os.environ.copy()
+        env["UV_CACHE_DIR"] = self.uv_cache_dir
+        env.update(extra)
+        return env
+
+    async def build_base(self):
+        """
+        Builds the base environment unless one for the same package set exists.
+        Server processes sharing `root` take turns, the first one builds it
+        and the others pick up its manifest.
+        """
+        lock_fd = await asyncio.to_thread(self._lock, "base.lock")
+        try:
+            await self._build_base()
+        finally:
+            os.close(lock_fd)
+
+    def _lock(self, name: str) -> int:
+        fd = os.open(os.path.join(self.root, name), os.O_CREAT | os.O_RDWR, 0o644)
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        return fd
+
+    async def _build_base(self):
+        base_hash = requirements_hash(self.base_packages)
+        if os.path.exists(self._manifest_path):
+            with open(self._manifest_path, "r") as f:
+                manifest = json.load(f)
+            if manifest.get("hash") == base_hash and os.path.exists(self.base_path):
+                self._base_versions = manifest["versions"]
+                log.info("Reusing existing base package environment.")
+                return
+
+        log.info(f"Building base package environment: {self.base_packages}")
+        await asyncio.to_thread(shutil.rmtree, self.base_path, True)
+        env = self.uv_env(VIRTUAL_ENV=self.base_path)
+        await run_command(["uv", "venv", self.base_path], env=env)
+        await run_command(
+            ["uv", "pip", "install", "--quiet"] + self.base_packages, env=env
+        )
+        freeze = await run_command(["uv", "pip", "freeze"], env=env)
+        versions = {}
+        for line in freeze.stdout.splitlines():
+            if "==" in line:
+                name, version = line.split("==", 1)
+                versions[canonical_name(name)] = version.strip()
+        with open(self._manifest_path, "w") as f:
+            json.dump({"hash": base_hash, "versions": versions}, f)
+        self._base_versions = versions
+
+    def is_satisfied_by_base(self, requirement: str) -> bool:
+        name, *rest = _SPECIFIER_RE.split(requirement, maxsplit=1)
+        name = name.split("[")[0]
+        installed = self._base_versions.get(name)
+        if installed is None:
+            return False
+        if not rest:
+            return True
+        # Only exact pins are compared, anything fancier goes to an overlay.
+        operator, version = rest
+        return operator in ("==", "===") and version == installed
+
+    async def resolve(self, packages: List[str]) -> Optional[str]:
+        """
+        Returns the overlay directory to put on sys.path for `packages`, or None
+        when the base environment already satisfies all of them. The overlay
+        stays in use, and is never evicted, until it is passed to `release`.
+        """
+        requirements = [
+            req
+            for req in normalize_requirements(packages)
+            if not self.is_satisfied_by_base(req)
+        ]
+        if not requirements:
+            self.base_hits += 1
+            return None
+
+        key = requirements_hash(requirements)
+        overlay_path = os.path.join(self.overlays_dir, key)
+        build_lock = self._build_locks.setdefault(key, asyncio.Lock())
+
+        # Concurrent requests for the same set wait for a single build.
+        async with build_lock:
+            # Held from here on, so another process can't evict it between
+            # the check below and the caller using it.
+            await self._acquire(key)
+            try:
+                if os.path.isdir(overlay_path):
+                    if key not in self._overlays:
+                        # Built by another server process sharing this cache.
+                        self._overlays[key] = await asyncio.to_thread(
+                            _dir_size, overlay_path
+                        )
+                    self.hits += 1
+                    self._overlays.move_to_end(key)
+                    os.utime(overlay_path)
+                    return overlay_path
+                # Unknown, or evicted by another server process.
+                self._overlays.pop(key, None)
+                self.misses += 1
+                await self._build_overlay(overlay_path, requirements)
+                self._overlays[key] = await asyncio.to_thread(_dir_size, overlay_path)
+                await self._evict(keep=key)
+            except BaseException:
+                self.release(overlay_path)
+                raise
+        return overlay_path
+
+    def release(self, overlay_path: str):
+        """Ends one use of an overlay returned by `resolve`."""
+        key = os.path.basename(overlay_path)
+        held = self._held.get(key)
+        if held is None:
+            return
+        held[1] -= 1
+        if held[1] == 0:
+            del self._held[key]
+            os.close(held[0])
+
+    async def _acquire(self, key: str):
+        held = self._held.get(key)
+        if held:
+            held[1] += 1
+            return
+        # Blocks while another process is evicting this overlay.
+        fd = await asyncio.to_thread(self._flock, key, fcntl.LOCK_SH)
+        self._held[key] = [fd, 1]
+
+    def _flock(self, key: str, operation: int) -> int:
+        fd = os.open(os.path.join(self.locks_dir, key), os.O_CREAT | os.O_RDWR, 0o644)
+        try:
+            fcntl.flock(fd, operation)
+        except BaseException:
+            os.close(fd)
+            raise
+        return fd
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "base_ready": int(self.base_ready),
+            "overlays": len(self._overlays),
+            "overlay_bytes": sum(self._overlays.values()),
+            "hits": self.hits,
+            "misses": self.misses,
+            "base_hits": self.base_hits,
+        }
+
+    async def _build_overlay(self, overlay_path: str, requirements: List[str]):
+        # Build next to the final location and rename, so a half-finished
+        # install is never picked up by a concurrent request.
+        # The pid tells other processes whether the build is still running.
+        staging_path = f"{overlay_path}.{os.getpid()}.{uuid.uuid4().hex}.tmp"
+        log.info(f"Building package overlay for {requirements}")
+        try:
+            await run_command(
+                ["uv", "pip", "install", "--quiet", "--target", staging_path]
+                + requirements,
+                env=self.uv_env(),
+            )
+            try:
+                os.replace(staging_path, overlay_path)
+            except OSError:
+                # Another process finished the same overlay first.
+                if not os.path.isdir(overlay_path):
+                    raise
+        finally:
+            await asyncio.to_thread(shutil.rmtree, staging_path, True)
+
+    async def _evict(self, keep: str):
+        total = sum(self._overlays.values())
+        if total <= self.max_bytes:
+            return
+        victims = [
+            (key, size)
+            for key, size in self._overlays.items()
+            if key != keep and not self._build_locks.get(key, asyncio.Lock()).locked()
+        ]
+        evicted = await asyncio.to_thread(self._evict_unused, victims, total)
+        for key in evicted:
+            self._overlays.pop(key, None)
+
+    def _evict_unused(self, victims: List[Tuple[str, int]], total: int) -> List[str]:
+        """
+        Deletes overlays from `victims`, oldest first, until `total` fits.
+        One process evicts at a time and an overlay that any process holds
+        (a shared lock on its lock file) is skipped.
+        """
+        evicted = []
+        evict_fd = self._lock("evict.lock")
+        try:
+            for key, size in victims:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    fd = self._flock(key, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue
+                try:
+                    log.info(f"Evicting package overlay {key}")
+                    shutil.rmtree(os.path.join(self.overlays_dir, key), True)
+                finally:
+                    os.close(fd)
+                total -= size
+                evicted.append(key)
+        finally:
+            os.close(evict_fd)
+        return evicted
+
+    def _load_overlays(self):
+        entries = []
+        for name in os.listdir(self.overlays_dir):
+            path = os.path.join(self.overlays_dir, name)
+            if name.endswith(".tmp"):
+                # A staging dir, only removed once the process building it
+                # (<key>.<pid>.<random>.tmp) is gone.
+                parts = name.split(".")
+                owner = int(parts[1]) if len(parts) == 4 and parts[1].isdigit() else 0
+                if not owner or not pid_alive(owner):
+                    shutil.rmtree(path, ignore_errors=True)
+            elif os.path.isdir(path):
+                entries.append((os.stat(path).st_mtime, name, path))
+        # Oldest first, so the OrderedDict order matches recency of use.
+        for _, name, path in sorted(entries):
+            self._overlays[name] = _dir_size(path)
+        if entries:
+            log.info(f"Loaded {len(entries)} cached package overlays.")
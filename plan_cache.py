@@ -0,0 +1,125 @@
+import csv
+import hashlib
+import json
+import logging
+import os
+from typing import Dict, List, Optional
+
+from cache import CacheBackend
+from sandbox_runtime.profiler import infer_type
+from schemas import GeneratedCode
+
+log = logging.getLogger(__name__)
+
+SCHEMA_SAMPLE_ROWS = 50
+JSON_SCHEMA_MAX_BYTES = 8 * 1024**2
+
+
+def _delimited_schema(path: str, delimiter: str) -> List[List[str]]:
+    with open(path, "r", newline="", errors="replace") as f:
+        reader = csv.reader(f, delimiter=delimiter)
+        header = next(reader, [])
+        rows = [row for _, row in zip(range(SCHEMA_SAMPLE_ROWS), reader)]
+    columns = []
+    for i, name in enumerate(header):
+        values = [row[i] for row in rows if i < len(row)]
+        columns.append([name, infer_type(values)])
+    return columns
+
+
+def _json_schema(path: str) -> object:
+    if os.path.getsize(path) > JSON_SCHEMA_MAX_BYTES:
+        return "json"
+    with open(path, "r", errors="replace") as f:
+        data = json.load(f)
+    record = data[0] if isinstance(data, list) and data else data
+    if isinstance(record, dict):
+        return sorted([key, type(value).__name__] for key, value in record.items())
+    return type(data).__name__
+
+
+def file_schema(path: str) -> object:
+    """
+    Cheap structural description of an uploaded file: column names and
+    inferred types for delimited text, keys for JSON, the extension otherwise.
+    """
+    ext = os.path.splitext(path)[1].lower()
+    try:
+        if ext in (".csv", ".tsv"):
+            return _delimited_schema(path, "\t" if ext == ".tsv" else ",")
+        if ext == ".json":
+            return _json_schema(path)
+    except (OSError, ValueError, csv.Error) as e:
+        log.warning(f"Could not read schema of {path}: {e}")
+    return ext or "unknown"
+
+
+def collect_schemas(temp_dir: str) -> Dict[str, object]:
+    return {
+        name: file_schema(os.path.join(temp_dir, name))
+        for name in sorted(os.listdir(temp_dir))
+        if name != "questions.txt"
+    }
+
+
+def plan_fingerprint(question: str, schemas: Dict[str, object]) -> str:
+    normalized_question = " ".join(question.lower().split())
+    payload = json.dumps([normalized_question, schemas], sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def session_plan(steps: List[GeneratedCode]) -> GeneratedCode:
+    """
+    One script that redoes a kernel session: the code of every clean run in
+    order, ending with the final answer. Later steps often use variables
+    (`df`, ...) that earlier ones left in the kernel, so the final script
+    alone can't be replayed in a fresh one.
+    """
+    libraries: List[str] = []
+    for step in steps:
+        libraries.extend(lib for lib in step.libraries if lib not in libraries)
+    return GeneratedCode(
+        code="\n\n".join(step.code for step in steps),
+        libraries=libraries,
+        is_final_answer=True,
+    )
+
+
+class PlanCache:
+    """
+    Remembers the scripts that produced an answer, keyed by the question and
+    the schemas of its input files, so a repeat of the same kind of question
+    can skip the LLM entirely. A plan that fails on replay is dropped.
+    """
+
+    def __init__(self, backends: List[CacheBackend]):
+        self.backends = backends
+        self.hits = 0
+        self.misses = 0
+        self.replay_failures = 0
+
+    async def get(self, fingerprint: str) -> Optional[GeneratedCode]:
+        for backend in self.backends:
+            value = await backend.get(fingerprint)
+            if value is not None:
+                self.hits += 1
+                return GeneratedCode.model_validate_json(value)
+        self.misses += 1
+        return None
+
+    async def set(self, fingerprint: str, plan: GeneratedCode):
+        value = plan.model_dump_json().encode()
+        for backend in self.backends:
+            await backend.set(fingerprint, value)
+
+    async def delete(self, fingerprint: str):
+        for backend in self.backends:
+            await backend.delete(fingerprint)
+
+    async def stats(self) -> Dict[str, object]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "replay_failures": self.replay_failures,
+            **{backend.name: await backend.stats() for backend in self.backends},
+        }
@@ -0,0 +1,110 @@
+import json
+import re
+from dataclasses import dataclass, field
+from typing import List, Literal, Optional, Sequence, Tuple
+
+_ITEM_RE = re.compile(r"^\s*(\d{1,2})[.)]\s+(\S.*)$")
+_KEY_RE = re.compile(r"^\s*[-*]\s*`([^`]+)`\s*:\s*(.*)$")
+_ARRAY_RE = re.compile(r"json\s+array", re.IGNORECASE)
+# Questions that build on another one's answer can't be solved on their own.
+_REFERENCE_RE = re.compile(
+    r"\b(?:question|item|step|part)\s*#?\d+\b"
+    r"|\b(?:above|previous(?:ly)?|preceding|earlier|prior)\b",
+    re.IGNORECASE,
+)
+
+
+@dataclass
+class SubTask:
+    number: int
+    text: str
+    key: Optional[str] = None
+    # The expected type/format from the key list, e.g. "base64 PNG string".
+    spec: str = ""
+
+
+@dataclass
+class QuestionPlan:
+    """
+    A questions.txt split into independent tasks. `context` is everything that
+    isn't one of the numbered questions (data description, source URLs,
+    formatting rules) and is given to every task.
+    """
+
+    context: str
+    output: Literal["array", "object"]
+    tasks: List[SubTask] = field(default_factory=list)
+
+    def task_prompt(self, task: SubTask) -> str:
+        prompt = (
+            f"{self.context}\n\n"
+            "This request has been split into separate tasks that are solved "
+            "independently. Solve only this one:\n"
+            f"{task.number}. {task.text}\n\n"
+            "Set `result` to the answer for this task alone as a JSON-serializable "
+            "value, it is placed into the final response for you."
+        )
+        if task.spec:
+            prompt += f"\nExpected answer format: {task.spec}"
+        return prompt
+
+    def assemble(self, results: Sequence[Optional[bytes]]) -> bytes:
+        """Joins the per-task JSON results without decoding them again."""
+        values = [result or b"null" for result in results]
+        if self.output == "array":
+            return b"[" + b",".join(values) + b"]"
+        return (
+            b"{"
+            + b",".join(
+                json.dumps(task.key).encode() + b":" + value
+                for task, value in zip(self.tasks, values)
+            )
+            + b"}"
+        )
+
+
+def split_questions(text: str, min_tasks: int = 2) -> Optional[QuestionPlan]:
+    """
+    Recognizes the usual layout of a numbered question list with either a
+    list of `key`: type lines (JSON object) or a request for a JSON array.
+    Returns None when the layout is anything else, when a question refers
+    to another one or when the keys don't pair up with the questions, the
+    query then runs as one script like before.
+    """
+    tasks: List[SubTask] = []
+    keys: List[Tuple[str, str]] = []
+    context: List[str] = []
+    in_item = False
+    for line in text.splitlines():
+        item = _ITEM_RE.match(line)
+        if item and int(item.group(1)) == len(tasks) + 1:
+            tasks.append(SubTask(len(tasks) + 1, item.group(2).strip()))
+            in_item = True
+            continue
+        key = _KEY_RE.match(line)
+        if key:
+            keys.append((key.group(1), key.group(2).strip()))
+            in_item = False
+            continue
+        if in_item and line.strip() and line[:1].isspace():
+            # Indented continuation of the current question.
+            tasks[-1].text += "\n" + line.strip()
+            continue
+        in_item = False
+        context.append(line)
+
+    if len(tasks) < min_tasks:
+        return None
+    if any(_REFERENCE_RE.search(task.text) for task in tasks):
+        return None
+    if keys:
+        if len(keys) != len(tasks):
+            return None
+        for task, (key, spec) in zip(tasks, keys):
+            task.key, task.spec = key, spec
+        output = "object"
+    elif _ARRAY_RE.search(text):
+        output = "array"
+    else:
+        return None
+    return QuestionPlan("\n".join(context).strip(), output, tasks)
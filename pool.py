@@ -0,0 +1,164 @@
+import asyncio
+import logging
+import os
+import shutil
+import uuid
+from typing import Dict, Optional, Set
+
+from process_utils import pid_alive
+from services import create_venv
+
+log = logging.getLogger(__name__)
+
+
+class VenvPool:
+    """
+    Keeps a number of ready-made uv virtualenvs around so a query doesn't have
+    to pay for `uv venv` before its first execution.
+    """
+
+    def __init__(self, root: str, size: int, prewarmed_dir: Optional[str] = None):
+        self.root = root
+        self.size = size
+        # Venvs built before the server forked, claimed by whichever worker
+        # renames them first.
+        self.prewarmed_dir = prewarmed_dir
+        self.hits = 0
+        self.misses = 0
+        self.recycled = 0
+        self.discarded = 0
+        self._ready: asyncio.Queue[str] = asyncio.Queue()
+        self._in_use: Set[str] = set()
+        self._pending = 0
+        self._tasks: Set[asyncio.Task] = set()
+        self._closed = False
+
+    async def start(self):
+        # Venvs from a previous run may have been half-built, start clean.
+        await asyncio.to_thread(shutil.rmtree, self.root, True)
+        os.makedirs(self.root, exist_ok=True)
+        claimed = await asyncio.to_thread(self._claim_prewarmed)
+        log.info(
+            f"Warming venv pool with {self.size} environments in {self.root} "
+            f"({claimed} prebuilt)"
+        )
+        self._schedule_refill()
+
+    def _claim_prewarmed(self) -> int:
+        claimed = 0
+        if not self.prewarmed_dir or not os.path.isdir(self.prewarmed_dir):
+            return claimed
+        for name in os.listdir(self.prewarmed_dir):
+            if claimed >= self.size:
+                break
+            venv_path = self._new_path()
+            try:
+                os.rename(os.path.join(self.prewarmed_dir, name), venv_path)
+            except OSError:
+                continue  # another worker got it first
+            self._ready.put_nowait(venv_path)
+            claimed += 1
+        return claimed
+
+    async def acquire(self) -> str:
+        try:
+            venv_path = self._ready.get_nowait()
+            self.hits += 1
+        except asyncio.QueueEmpty:
+            self.misses += 1
+            log.info("Venv pool empty, creating an environment on demand.")
+            venv_path = self._new_path()
+            await create_venv(venv_path)
+        self._in_use.add(venv_path)
+        self._schedule_refill()
+        return venv_path
+
+    def release(self, venv_path: str, dirty: bool = False):
+        """
+        Hands an environment back. Environments that had packages installed
+        into them are thrown away since their site-packages no longer match
+        a fresh venv.
+        """
+        self._in_use.discard(venv_path)
+        if self._closed or dirty or self._ready.qsize() + self._pending >= self.size:
+            self.discarded += 1
+            self._spawn(asyncio.to_thread(shutil.rmtree, venv_path, True))
+        else:
+            self.recycled += 1
+            self._ready.put_nowait(venv_path)
+        self._schedule_refill()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "size": self.size,
+            "ready": self._ready.qsize(),
+            "in_use": len(self._in_use),
+            "pending": self._pending,
+            "hits": self.hits,
+            "misses": self.misses,
+            "recycled": self.recycled,
+            "discarded": self.discarded,
+        }
+
+    async def close(self):
+        self._closed = True
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        await asyncio.to_thread(shutil.rmtree, self.root, True)
+
+    def _new_path(self) -> str:
+        return os.path.join(self.root, uuid.uuid4().hex)
+
+    def _schedule_refill(self):
+        if self._closed:
+            return
+        missing = self.size - self._ready.qsize() - self._pending
+        for _ in range(max(missing, 0)):
+            self._pending += 1
+            self._spawn(self._build_one())
+
+    async def _build_one(self):
+        venv_path = self._new_path()
+        try:
+            await create_venv(venv_path)
+            if self._closed:
+                await asyncio.to_thread(shutil.rmtree, venv_path, True)
+            else:
+                self._ready.put_nowait(venv_path)
+        except Exception as e:
+            log.error(f"Failed to build pooled venv: {e}")
+        finally:
+            self._pending -= 1
+
+    def _spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+
+def remove_stale_pools(parent: str):
+    """Deletes `worker-<pid>` pool directories left behind by dead processes."""
+    if not os.path.isdir(parent):
+        return
+    for name in os.listdir(parent):
+        if not name.startswith("worker-"):
+            continue
+        try:
+            pid = int(name[len("worker-") :])
+        except ValueError:
+            continue
+        if not pid_alive(pid):
+            shutil.rmtree(os.path.join(parent, name), ignore_errors=True)
+
+
+async def prebuild_venvs(directory: str, count: int):
+    """Builds `count` venvs into `directory` for workers to claim on start."""
+    os.makedirs(directory, exist_ok=True)
+    missing = count - len(os.listdir(directory))
+    await asyncio.gather(
+        *(
+            create_venv(os.path.join(directory, uuid.uuid4().hex))
+            for _ in range(max(missing, 0))
+        )
+    )
@@ -0,0 +1,69 @@
+import asyncio
+import os
+import signal
+import subprocess
+from typing import Dict, List, Optional
+
+
+async def run_command(
+    command: List[str],
+    check: bool = True,
+    timeout: Optional[float] = None,
+    env: Optional[Dict[str, str]] = None,
+    cwd: Optional[str] = None,
+) -> subprocess.CompletedProcess:
+    """
+    Async counterpart of `subprocess.run(..., capture_output=True, text=True)`.
+    Raises the same CalledProcessError/TimeoutExpired so callers can keep their
+    error handling, and kills the child's whole process group if it times out
+    or the caller is cancelled.
+    """
+    proc = await asyncio.create_subprocess_exec(
+        *command,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        env=env,
+        cwd=cwd,
+        start_new_session=True,
+    )
+    try:
+        stdout, stderr = await asyncio.wait_for(proc.communicate(), timeout)
+    except asyncio.TimeoutError:
+        await kill_process_group(proc)
+        raise subprocess.TimeoutExpired(command, timeout)  # type: ignore
+    except asyncio.CancelledError:
+        await kill_process_group(proc)
+        raise
+
+    completed = subprocess.CompletedProcess(
+        command,
+        proc.returncode,  # type: ignore
+        stdout.decode(errors="replace"),
+        stderr.decode(errors="replace"),
+    )
+    if check and completed.returncode != 0:
+        raise subprocess.CalledProcessError(
+            completed.returncode, command, completed.stdout, completed.stderr
+        )
+    return completed
+
+
+async def kill_process_group(proc: asyncio.subprocess.Process):
+    """Kills a child started with start_new_session=True and everything it spawned."""
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+    if proc.returncode is None:
+        await proc.wait()
+
+
+def pid_alive(pid: int) -> bool:
+    """Whether a process with this pid exists, even one owned by someone else."""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
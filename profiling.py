@@ -0,0 +1,44 @@
+import json
+from typing import Any, Dict
+
+PROFILE_HEADER = "---FILE PROFILES---"
+
+
+def format_profiles(profiles: Dict[str, Any], max_chars: int) -> str:
+    """
+    Renders the sandbox profiler output as compact JSON lines, one per file,
+    dropping sample rows first and then whole files to stay within max_chars.
+    """
+    lines = [
+        f"{name}: {json.dumps(profile, separators=(',', ':'), default=str)}"
+        for name, profile in profiles.items()
+    ]
+    if sum(len(line) for line in lines) > max_chars:
+        for profile in profiles.values():
+            _strip_samples(profile)
+        lines = [
+            f"{name}: {json.dumps(profile, separators=(',', ':'), default=str)}"
+            for name, profile in profiles.items()
+        ]
+
+    kept, used = [], 0
+    for line in lines:
+        if used + len(line) > max_chars:
+            kept.append(f"... {len(lines) - len(kept)} more file(s) omitted")
+            break
+        kept.append(line)
+        used += len(line)
+    return "\n".join(kept)
+
+
+def _strip_samples(profile: Any):
+    if isinstance(profile, dict):
+        profile.pop("sample", None)
+        for value in profile.values():
+            _strip_samples(value)
+
+
+def build_initial_prompt(question: str, profiles: Dict[str, Any], max_chars: int) -> str:
+    if not profiles:
+        return question
+    return f"{question}\n\n{PROFILE_HEADER}\n{format_profiles(profiles, max_chars)}"
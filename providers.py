@@ -0,0 +1,117 @@
+import importlib
+import logging
+import sys
+from typing import TYPE_CHECKING, Dict, List, Literal, Union
+
+import httpx
+
+from services import LLMClient
+
+if TYPE_CHECKING:
+    from google import genai
+    from openai import AsyncOpenAI
+
+log = logging.getLogger(__name__)
+
+# Each SDK takes about half a second to import, a server only loads the one
+# it talks to, on first use or through `load_sdk` at startup.
+SDK_MODULES = {"gemini": "google.genai", "openai": "openai"}
+
+try:
+    import h2  # noqa: F401
+
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+def _http_client(max_connections: int, keepalive_expiry: float) -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        http2=HTTP2_AVAILABLE,
+        limits=httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_connections,
+            keepalive_expiry=keepalive_expiry,
+        ),
+        timeout=httpx.Timeout(120, connect=10),
+    )
+
+
+def load_sdk(provider: Literal["gemini", "openai"]):
+    importlib.import_module(SDK_MODULES[provider])
+
+
+def sdk_loaded(provider: Literal["gemini", "openai"]) -> bool:
+    return SDK_MODULES[provider] in sys.modules
+
+
+class ProviderRegistry:
+    """
+    Provider SDK clients shared by every request, so their connection pools
+    (HTTP/2 when `h2` is installed) stay warm. Each client is built on first
+    use; requests get a cheap `LLMClient` session holding only their
+    conversation.
+    """
+
+    def __init__(
+        self,
+        gemini_api_key: str,
+        openai_api_key: str,
+        openai_base_url: str,
+        max_connections: int = 32,
+        keepalive_expiry: float = 300,
+    ):
+        self.gemini_api_key = gemini_api_key
+        self.openai_api_key = openai_api_key
+        self.openai_base_url = openai_base_url
+        self.max_connections = max_connections
+        self.keepalive_expiry = keepalive_expiry
+        self._clients: Dict[str, Union["AsyncOpenAI", "genai.Client"]] = {}
+        self._http_clients: List[httpx.AsyncClient] = []
+        if not HTTP2_AVAILABLE:
+            log.info("h2 is not installed, provider clients fall back to HTTP/1.1.")
+
+    def client(
+        self, provider: Literal["gemini", "openai"]
+    ) -> Union["AsyncOpenAI", "genai.Client"]:
+        if provider not in self._clients:
+            http_client = _http_client(self.max_connections, self.keepalive_expiry)
+            if provider == "openai":
+                from openai import AsyncOpenAI
+
+                client = AsyncOpenAI(
+                    base_url=self.openai_base_url,
+                    api_key=self.openai_api_key,
+                    http_client=http_client,
+                )
+            else:
+                from google import genai
+                from google.genai import types
+
+                client = genai.Client(
+                    api_key=self.gemini_api_key,
+                    http_options=types.HttpOptions(httpx_async_client=http_client),
+                )
+            # Only keep the pool once the SDK accepted its credentials.
+            self._http_clients.append(http_client)
+            self._clients[provider] = client
+        return self._clients[provider]
+
+    def session(
+        self,
+        provider: Literal["gemini", "openai"],
+        context_token_budget: int,
+        context_keep_recent: int,
+    ) -> LLMClient:
+        return LLMClient(
+            self.client(provider),
+            provider,
+            context_token_budget,
+            context_keep_recent,
+        )
+
+    async def aclose(self):
+        for http_client in self._http_clients:
+            await http_client.aclose()
+        self._http_clients.clear()
+        self._clients.clear()
@@ -0,0 +1,83 @@
+"""
+Images for answers that ask for base64 PNG/WebP data URIs under a size limit.
+
+    import artifacts
+    uri = artifacts.figure_uri(fig, max_bytes=100_000)
+    uris = artifacts.all_figures(max_bytes=100_000)   # every open figure
+
+The figure is rendered at decreasing DPI, and at each DPI as PNG, as a
+palette-quantised PNG and (with format="webp") as WebP, until the encoded
+string fits in `max_bytes`. The limit counts the whole returned string,
+prefix included, so the result can be compared against the question's limit
+as-is. Figures are closed once encoded.
+"""
+
+import base64
+import io
+
+DPIS = (100, 80, 64, 50, 40, 32)
+MIME = {"png": "image/png", "webp": "image/webp"}
+
+
+def _encodings(fig, dpi, fmt):
+    buf = io.BytesIO()
+    fig.savefig(buf, format="png", dpi=dpi, bbox_inches="tight")
+    png = buf.getvalue()
+    if fmt == "png":
+        yield png, "png"
+    try:
+        from PIL import Image
+    except ImportError:
+        return
+    with Image.open(io.BytesIO(png)) as image:
+        image = image.convert("RGB")
+        if fmt == "png":
+            for colors in (256, 64):
+                buf = io.BytesIO()
+                quantized = image.quantize(colors, method=Image.Quantize.FASTOCTREE)
+                quantized.save(buf, format="PNG", optimize=True)
+                yield buf.getvalue(), "png"
+        else:
+            for quality in (85, 65, 45):
+                buf = io.BytesIO()
+                image.save(buf, format="WEBP", quality=quality, method=4)
+                yield buf.getvalue(), "webp"
+
+
+def _encode(data, fmt, prefix):
+    text = base64.b64encode(data).decode()
+    return f"data:{MIME[fmt]};base64,{text}" if prefix else text
+
+
+def figure_uri(fig=None, max_bytes=100_000, format="png", prefix=True, close=True):
+    """
+    `fig` (the current figure by default) as a base64 data URI, or bare
+    base64 with prefix=False, no longer than `max_bytes` characters.
+    Returns the smallest attempt if nothing fits.
+    """
+    import matplotlib.pyplot as plt
+
+    fig = fig or plt.gcf()
+    smallest = None
+    try:
+        for dpi in DPIS:
+            for data, fmt in _encodings(fig, dpi, format):
+                encoded = _encode(data, fmt, prefix)
+                if len(encoded) <= max_bytes:
+                    return encoded
+                if smallest is None or len(encoded) < len(smallest):
+                    smallest = encoded
+        return smallest
+    finally:
+        if close:
+            plt.close(fig)
+
+
+def all_figures(max_bytes=100_000, format="png", prefix=True):
+    """Every open matplotlib figure, in creation order, see `figure_uri`."""
+    import matplotlib.pyplot as plt
+
+    return [
+        figure_uri(plt.figure(number), max_bytes, format, prefix)
+        for number in plt.get_fignums()
+    ]
@@ -0,0 +1,162 @@
+"""
+Columnar copies of uploaded tabular files.
+
+Large CSV/TSV and JSON Lines uploads are converted once, right after upload,
+into an uncompressed Arrow IPC file next to the original (`sales.csv` ->
+`sales.csv.arrow`). Opening that copy memory-maps it: no parsing, and columns
+that aren't used are never read from disk. Generated code uses it through
+
+    import columnar
+    df = columnar.read("sales.csv")              # pandas DataFrame
+    tbl = columnar.table("sales.csv", ["a"])     # pyarrow Table, zero-copy
+
+and both fall back to parsing the original file when there is no copy.
+
+The server runs this file as a script with the base environment's
+interpreter: `python columnar.py DIRECTORY MIN_BYTES [MEMORY_BYTES]`. It
+prints the converted files as JSON.
+"""
+
+import csv
+import json
+import os
+import sys
+
+SUFFIX = ".arrow"
+DELIMITED = (".csv", ".tsv")
+JSON_LINES = (".jsonl", ".ndjson", ".json")
+
+
+def arrow_path(name):
+    return name + SUFFIX
+
+
+def _is_json_lines(path):
+    with open(path, "rb") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                return line.startswith(b"{")
+    return False
+
+
+def _delimiter(path):
+    with open(path, "r", newline="", errors="replace") as f:
+        head = f.read(64 * 1024)
+    try:
+        return csv.Sniffer().sniff(head, delimiters=",;\t|").delimiter
+    except csv.Error:
+        return "\t" if path.lower().endswith(".tsv") else ","
+
+
+def _write_delimited(path, target):
+    import pyarrow as pa
+    import pyarrow.csv as pacsv
+
+    # Streamed batch by batch, so memory stays bounded by the block size.
+    reader = pacsv.open_csv(
+        path, parse_options=pacsv.ParseOptions(delimiter=_delimiter(path))
+    )
+    rows = 0
+    with pa.OSFile(target, "wb") as sink:
+        with pa.ipc.new_file(sink, reader.schema) as writer:
+            for batch in reader:
+                writer.write_batch(batch)
+                rows += batch.num_rows
+    return rows
+
+
+def _write_json_lines(path, target):
+    import pyarrow as pa
+    import pyarrow.json as pajson
+
+    table = pajson.read_json(path)
+    with pa.OSFile(target, "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    return table.num_rows
+
+
+def convert_file(path):
+    """Writes the Arrow copy of `path`, returns its row count or None."""
+    ext = os.path.splitext(path)[1].lower()
+    if ext in DELIMITED:
+        write = _write_delimited
+    elif ext in JSON_LINES and _is_json_lines(path):
+        write = _write_json_lines
+    else:
+        return None
+    target = arrow_path(path)
+    partial = target + ".part"
+    try:
+        rows = write(path, partial)
+        os.replace(partial, target)
+        return rows
+    finally:
+        if os.path.exists(partial):
+            os.remove(partial)
+
+
+def convert_directory(directory=".", min_bytes=0):
+    converted = {}
+    for name in sorted(os.listdir(directory)):
+        path = os.path.join(directory, name)
+        if name.startswith(".") or not os.path.isfile(path):
+            continue
+        if os.path.getsize(path) < min_bytes:
+            continue
+        try:
+            rows = convert_file(path)
+        except Exception as e:
+            converted[name] = {"error": f"{type(e).__name__}: {e}"}
+            continue
+        if rows is not None:
+            converted[name] = {"arrow": arrow_path(name), "rows": rows}
+    return converted
+
+
+def table(name, columns=None):
+    """The file as a pyarrow Table, memory-mapped when an Arrow copy exists."""
+    import pyarrow as pa
+
+    if os.path.exists(arrow_path(name)):
+        source = pa.memory_map(arrow_path(name), "r")
+        data = pa.ipc.open_file(source).read_all()
+        return data.select(columns) if columns else data
+    ext = os.path.splitext(name)[1].lower()
+    if ext in DELIMITED:
+        import pyarrow.csv as pacsv
+
+        return pacsv.read_csv(
+            name,
+            parse_options=pacsv.ParseOptions(delimiter=_delimiter(name)),
+            convert_options=pacsv.ConvertOptions(include_columns=columns),
+        )
+    import pyarrow.json as pajson
+
+    data = pajson.read_json(name)
+    return data.select(columns) if columns else data
+
+
+def read(name, columns=None):
+    """The file as a pandas DataFrame, see `table`."""
+    if not os.path.exists(arrow_path(name)):
+        ext = os.path.splitext(name)[1].lower()
+        if ext not in DELIMITED and not _is_json_lines(name):
+            import pandas as pd
+
+            df = pd.read_json(name)
+            return df[columns] if columns else df
+    return table(name, columns).to_pandas()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 3 and int(sys.argv[3]):
+        import resource
+
+        _, hard = resource.getrlimit(resource.RLIMIT_AS)
+        memory_bytes = int(sys.argv[3])
+        if hard != resource.RLIM_INFINITY:
+            memory_bytes = min(memory_bytes, hard)
+        resource.setrlimit(resource.RLIMIT_AS, (memory_bytes, hard))
+    print(json.dumps(convert_directory(sys.argv[1], int(sys.argv[2]))))
@@ -0,0 +1,124 @@
+"""
+Forkserver for sandbox kernels.
+
+Started once per server process with the base environment's interpreter:
+
+    python forkserver.py SOCKET_PATH MODULE [MODULE ...]
+
+It imports the given modules (pandas, numpy, matplotlib.pyplot, ...) and
+prints one JSON line with how long that took and which top-level packages
+ended up imported. After that every connection
+on SOCKET_PATH asks for a kernel: the client sends one frame with the
+kernel's `cwd` and `env`, the forkserver forks, and the child becomes a
+kernel.py process speaking the usual frame protocol over the connection,
+starting with a frame holding its pid. The child shares the already
+imported modules copy-on-write, so a kernel starts in milliseconds instead
+of paying the imports again.
+
+Isolation: the forkserver itself never runs user code, so every child starts
+from the same state right after the imports. Each child gets its own
+session, working directory and environment, closes the listening socket and
+reseeds the random number generators it inherited.
+"""
+
+import importlib
+import json
+import os
+import signal
+import socket
+import sys
+import time
+
+import kernel
+
+
+def _preload(modules):
+    failed = []
+    for name in modules:
+        try:
+            importlib.import_module(name)
+        except Exception as e:
+            failed.append(f"{name}: {type(e).__name__}: {e}")
+    return failed
+
+
+def _imported_packages():
+    stdlib = getattr(sys, "stdlib_module_names", ())
+    tops = {name.split(".")[0] for name in list(sys.modules)}
+    own = ("__main__", "kernel")
+    return sorted(name for name in tops if name not in stdlib and name not in own)
+
+
+def _reseed():
+    import random
+
+    random.seed()
+    numpy = sys.modules.get("numpy")
+    if numpy is not None:
+        numpy.random.seed()
+
+
+def _become_kernel(listener, conn, request):
+    listener.close()
+    os.setsid()
+    os.chdir(request["cwd"])
+    os.environ.clear()
+    os.environ.update(request["env"])
+    _reseed()
+    signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+    # kernel.main() talks over fds 0 and 1 like it does for a pipe.
+    os.dup2(conn.fileno(), 0)
+    os.dup2(conn.fileno(), 1)
+    conn.close()
+    with os.fdopen(os.dup(1), "wb") as handshake:
+        kernel.write_frame(handshake, json.dumps({"pid": os.getpid()}).encode())
+    kernel.main()
+
+
+def serve(socket_path, modules):
+    start = time.perf_counter()
+    failed = _preload(modules)
+    preload_seconds = time.perf_counter() - start
+
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(socket_path)
+    os.chmod(socket_path, 0o600)
+    listener.listen(64)
+    # Kernels are never waited for, let the kernel reap them.
+    signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+    status = {
+        "preload_seconds": preload_seconds,
+        "failed": failed,
+        "packages": _imported_packages(),
+    }
+    print(json.dumps(status))
+    sys.stdout.flush()
+
+    parent = os.getppid()
+    listener.settimeout(1.0)
+    while os.getppid() == parent:
+        try:
+            conn, _ = listener.accept()
+        except socket.timeout:
+            continue
+        conn.settimeout(None)
+        try:
+            with conn.makefile("rb") as stream:
+                request = json.loads(kernel.read_frame(stream))
+        except (EOFError, OSError, ValueError):
+            conn.close()
+            continue
+        if os.fork() == 0:
+            try:
+                _become_kernel(listener, conn, request)
+            finally:
+                os._exit(0)
+        conn.close()
+    # The server went away without stopping us.
+    os.unlink(socket_path)
+
+
+if __name__ == "__main__":
+    serve(sys.argv[1], sys.argv[2:])
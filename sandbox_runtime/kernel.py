@@ -0,0 +1,280 @@
+"""
+Long-lived execution kernel started inside a sandbox venv.
+
+The server sends code over stdin and gets stdout/stderr/result back over
+stdout, both as length-prefixed frames. The namespace survives between
+executions, so data loaded by one iteration is still there for the next.
+This file is executed with the sandbox interpreter and must only depend on
+the standard library; orjson is used when the sandbox happens to have it.
+
+`result` is sent back as UTF-8 JSON bytes the server can hand straight to the
+HTTP response. A string is taken to already be JSON (generated code usually
+ends with `result = json.dumps(...)`) and is only validated, anything else
+is encoded here with NumPy/pandas values converted to plain JSON types.
+
+Resource limits arrive as JSON in TDS_SANDBOX_LIMITS and are applied to the
+kernel itself before any user code runs; the CPU limit is re-armed before
+every execution so it bounds each run rather than the kernel's lifetime.
+The variable stays set, sql.py sizes DuckDB from it.
+"""
+
+import base64
+import datetime
+import decimal
+import json
+import math
+import os
+import resource
+import signal
+import struct
+import sys
+import tempfile
+import traceback
+
+HEADER = struct.Struct("!I")
+
+# orjson is looked up on first use: in a kernel started without PYTHONPATH it
+# is only importable once a request's `sys_path` has been applied. False once
+# it turned out to be missing.
+_orjson = None
+
+
+class ResultError(Exception):
+    pass
+
+
+class CPUTimeExceeded(BaseException):
+    # BaseException so a bare `except Exception` in user code can't swallow it.
+    pass
+
+
+def read_frame(stream) -> bytes:
+    header = stream.read(HEADER.size)
+    if len(header) < HEADER.size:
+        raise EOFError
+    (length,) = HEADER.unpack(header)
+    return stream.read(length)
+
+
+def write_frame(stream, payload: bytes):
+    stream.write(HEADER.pack(len(payload)) + payload)
+    stream.flush()
+
+
+def _redirect(stdout_fd: int, stderr_fd: int):
+    sys.stdout.flush()
+    sys.stderr.flush()
+    os.dup2(stdout_fd, 1)
+    os.dup2(stderr_fd, 2)
+
+
+def _read_capture(f, limit: int) -> str:
+    # Keep the head and the tail, that's where the useful lines usually are.
+    f.flush()
+    size = f.seek(0, os.SEEK_END)
+    f.seek(0)
+    if not limit or size <= limit:
+        return f.read().decode(errors="replace")
+    head = f.read(limit // 2)
+    f.seek(size - limit // 2)
+    tail = f.read()
+    skipped = size - len(head) - len(tail)
+    return (
+        head.decode(errors="replace")
+        + f"\n... [{skipped} bytes of output truncated] ...\n"
+        + tail.decode(errors="replace")
+    )
+
+
+def _raise_cpu_exceeded(signum, frame):
+    raise CPUTimeExceeded("CPU time limit for this execution exceeded.")
+
+
+def apply_limits(limits: dict):
+    def lower(kind, value):
+        _, hard = resource.getrlimit(kind)
+        if hard != resource.RLIM_INFINITY:
+            value = min(value, hard)
+        resource.setrlimit(kind, (value, hard))
+
+    resource.setrlimit(resource.RLIMIT_CORE, (0, 0))
+    if limits.get("memory_bytes"):
+        lower(resource.RLIMIT_AS, limits["memory_bytes"])
+    if limits.get("max_file_bytes"):
+        # Fail the write with EFBIG instead of killing the kernel.
+        signal.signal(signal.SIGXFSZ, signal.SIG_IGN)
+        lower(resource.RLIMIT_FSIZE, limits["max_file_bytes"])
+    # RLIMIT_NPROC counts every process of the user, not just this kernel's,
+    # so the process cap is only enforced through the cgroup's pids.max.
+    signal.signal(signal.SIGXCPU, _raise_cpu_exceeded)
+
+
+def _arm_cpu_limit(seconds: int):
+    # RLIMIT_CPU is cumulative, so move the soft limit to "used + budget".
+    # The hard limit is left alone, lowering it could never be undone.
+    _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    if not seconds:
+        resource.setrlimit(resource.RLIMIT_CPU, (hard, hard))
+        return
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    soft = math.ceil(usage.ru_utime + usage.ru_stime) + seconds
+    if hard != resource.RLIM_INFINITY:
+        soft = min(soft, hard)
+    resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+
+
+def execute(
+    namespace: dict,
+    code: str,
+    max_result_bytes: int,
+    devnull: int,
+    limits: dict,
+) -> dict:
+    # fd-level capture also picks up output from C extensions and children
+    with tempfile.TemporaryFile() as out, tempfile.TemporaryFile() as err:
+        _redirect(out.fileno(), err.fileno())
+        ok = True
+        namespace.pop("result", None)
+        try:
+            _arm_cpu_limit(limits.get("cpu_seconds", 0))
+            exec(compile(code, "<string>", "exec"), namespace)
+        except SystemExit as e:
+            ok = e.code in (None, 0)
+        except BaseException as e:
+            ok = False
+            # Skip this module's frame, the user only cares about their code.
+            traceback.print_exception(type(e), e, e.__traceback__.tb_next)
+        finally:
+            _arm_cpu_limit(0)
+            _redirect(devnull, devnull)
+        max_output = limits.get("max_output_bytes", 0)
+        stdout, stderr = _read_capture(out, max_output), _read_capture(err, max_output)
+
+    result, result_error = b"", None
+    if "result" in namespace:
+        try:
+            result = encode_result(namespace["result"], max_result_bytes)
+        except ResultError as e:
+            result_error = str(e)
+        except Exception as e:
+            result_error = f"Failed to serialize result variable: {e}"
+    return {
+        "ok": ok,
+        "stdout": stdout,
+        "stderr": stderr,
+        "result_error": result_error,
+        "result": result,
+    }
+
+
+def _to_builtin(value):
+    # Called for anything json/orjson can't encode natively.
+    if hasattr(value, "to_dict") and hasattr(value, "columns"):
+        return value.to_dict(orient="records")  # DataFrame
+    if hasattr(value, "tolist"):
+        return value.tolist()  # ndarray, Series, Index, NumPy scalars
+    if hasattr(value, "item"):
+        return value.item()
+    if isinstance(value, (datetime.date, datetime.datetime, datetime.time)):
+        return value.isoformat()
+    if hasattr(value, "isoformat"):
+        return value.isoformat()  # pandas Timestamp
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    if isinstance(value, (set, frozenset, tuple)):
+        return list(value)
+    if isinstance(value, (bytes, bytearray)):
+        return base64.b64encode(value).decode()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _replace_nan(value):
+    # The stdlib would emit NaN/Infinity, which isn't valid JSON.
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    if isinstance(value, list):
+        return [_replace_nan(v) for v in value]
+    if isinstance(value, dict):
+        return {k: _replace_nan(v) for k, v in value.items()}
+    return value
+
+
+def _load_orjson():
+    global _orjson
+    if _orjson is None:
+        try:
+            import orjson
+
+            _orjson = orjson
+        except ImportError:
+            _orjson = False
+    return _orjson
+
+
+def encode_result(value, max_bytes: int) -> bytes:
+    orjson = _load_orjson()
+    if isinstance(value, (bytes, bytearray)):
+        value = bytes(value).decode("utf-8", errors="replace")
+    if isinstance(value, str):
+        encoded = value.encode()
+        if len(encoded) > max_bytes:
+            raise ResultError(
+                f"`result` is {len(encoded)} bytes, over the {max_bytes} byte limit."
+            )
+        try:
+            (orjson.loads if orjson else json.loads)(encoded)
+        except ValueError as e:
+            raise ResultError(f"`result` is a string but not valid JSON: {e}")
+        return encoded
+
+    if orjson:
+        encoded = orjson.dumps(
+            value,
+            default=_to_builtin,
+            option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS,
+        )
+    else:
+        try:
+            encoded = json.dumps(
+                value, default=_to_builtin, separators=(",", ":"), allow_nan=False
+            ).encode()
+        except ValueError:
+            value = _replace_nan(json.loads(json.dumps(value, default=_to_builtin)))
+            encoded = json.dumps(value, separators=(",", ":")).encode()
+    if len(encoded) > max_bytes:
+        raise ResultError(
+            f"`result` is {len(encoded)} bytes as JSON, over the {max_bytes} byte limit."
+        )
+    return encoded
+
+
+def main():
+    # Keep private handles on the original pipes, fds 0-2 then belong to
+    # the user code.
+    requests = os.fdopen(os.dup(0), "rb")
+    responses = os.fdopen(os.dup(1), "wb")
+    devnull = os.open(os.devnull, os.O_RDWR)
+    os.dup2(devnull, 0)
+    _redirect(devnull, devnull)
+    limits = json.loads(os.environ.get("TDS_SANDBOX_LIMITS") or "{}")
+    apply_limits(limits)
+
+    namespace = {"__name__": "__main__", "__builtins__": __builtins__}
+    while True:
+        try:
+            request = json.loads(read_frame(requests))
+        except EOFError:
+            break
+        for path in reversed(request.get("sys_path", [])):
+            if path not in sys.path:
+                sys.path.insert(0, path)
+        reply = execute(
+            namespace, request["code"], request["max_result_bytes"], devnull, limits
+        )
+        result = reply.pop("result")
+        write_frame(responses, json.dumps(reply).encode())
+        write_frame(responses, result)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+"""
+Cheap profiles of uploaded data files, run inside the sandbox kernel before
+the first LLM call so the model doesn't need a turn just to look at the data.
+
+Every reader is bounded: only the first `scan_rows` rows (or the Parquet
+footer and first batch) are touched. Delimited text, JSON and SQLite use the
+standard library; Parquet and Excel use pyarrow/pandas when the sandbox has
+them.
+"""
+
+import csv
+import itertools
+import json
+import os
+import sqlite3
+
+SKIP_FILES = {"questions.txt"}
+
+
+def infer_type(values):
+    kinds = set()
+    for value in values:
+        if value is None or value == "":
+            continue
+        if isinstance(value, bool):
+            kinds.add("bool")
+            continue
+        if isinstance(value, (int, float)):
+            kinds.add(type(value).__name__)
+            continue
+        try:
+            int(value)
+            kinds.add("int")
+            continue
+        except (TypeError, ValueError):
+            pass
+        try:
+            float(value)
+            kinds.add("float")
+        except (TypeError, ValueError):
+            kinds.add("str")
+    if not kinds:
+        return "empty"
+    if kinds <= {"int", "float"}:
+        return "float" if "float" in kinds else "int"
+    return "str" if "str" in kinds else "/".join(sorted(kinds))
+
+
+def _columns(header, rows):
+    columns = []
+    for i, name in enumerate(header):
+        values = [row[i] if i < len(row) else None for row in rows]
+        columns.append(
+            {
+                "name": str(name),
+                "type": infer_type(values),
+                "nulls_in_sample": sum(1 for v in values if v in (None, "")),
+            }
+        )
+    return columns
+
+
+def _short(value, limit=80):
+    text = str(value)
+    return text if len(text) <= limit else text[:limit] + "..."
+
+
+def profile_delimited(path, scan_rows, sample_rows):
+    with open(path, "r", newline="", errors="replace") as f:
+        head = f.read(64 * 1024)
+        f.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(head, delimiters=",;\t|")
+        except csv.Error:
+            dialect = csv.excel
+        reader = csv.reader(f, dialect)
+        header = next(reader, [])
+        rows = list(itertools.islice(reader, scan_rows))
+    return {
+        "format": "delimited",
+        "delimiter": dialect.delimiter,
+        "columns": _columns(header, rows),
+        "rows_scanned": len(rows),
+        "sample": [[_short(v) for v in row] for row in rows[:sample_rows]],
+    }
+
+
+def profile_json(path, scan_rows, sample_rows, max_bytes):
+    # JSON Lines is read line by line, plain JSON only when it is small.
+    with open(path, "r", errors="replace") as f:
+        first = f.readline()
+        try:
+            record = json.loads(first)
+            is_lines = isinstance(record, dict) and bool(f.readline().strip())
+        except ValueError:
+            is_lines = False
+        f.seek(0)
+        if is_lines:
+            records = [json.loads(line) for line in itertools.islice(f, scan_rows)]
+        elif os.path.getsize(path) <= max_bytes:
+            data = json.load(f)
+            if isinstance(data, dict):
+                list_keys = [k for k, v in data.items() if isinstance(v, list)]
+                if len(list_keys) != 1:
+                    return {
+                        "format": "json",
+                        "top_level_keys": [_short(k) for k in list(data)[:50]],
+                    }
+                data = data[list_keys[0]]
+            records = data[:scan_rows] if isinstance(data, list) else []
+        else:
+            return {"format": "json", "note": "too large to sample without a parse"}
+
+    dict_records = [r for r in records if isinstance(r, dict)]
+    if not dict_records:
+        return {
+            "format": "json",
+            "type": type(records).__name__,
+            "sample": [_short(r) for r in records[:sample_rows]],
+        }
+    header = list(dict.fromkeys(k for r in dict_records for k in r))
+    rows = [[r.get(k) for k in header] for r in dict_records]
+    return {
+        "format": "jsonl" if is_lines else "json",
+        "columns": _columns(header, rows),
+        "rows_scanned": len(rows),
+        "sample": [[_short(v) for v in row] for row in rows[:sample_rows]],
+    }
+
+
+def profile_sqlite(path, sample_rows):
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        tables = {}
+        names = conn.execute(
+            "SELECT name FROM sqlite_master WHERE type IN ('table', 'view')"
+        ).fetchall()
+        for (table,) in names[:20]:
+            info = conn.execute(f'PRAGMA table_info("{table}")').fetchall()
+            sample = conn.execute(
+                f'SELECT * FROM "{table}" LIMIT {int(sample_rows)}'
+            ).fetchall()
+            tables[table] = {
+                "columns": [{"name": c[1], "type": c[2]} for c in info],
+                "sample": [[_short(v) for v in row] for row in sample],
+            }
+        return {"format": "sqlite", "tables": tables}
+    finally:
+        conn.close()
+
+
+def profile_parquet(path, sample_rows):
+    import pyarrow.parquet as pq
+
+    parquet_file = pq.ParquetFile(path)
+    batch = next(parquet_file.iter_batches(batch_size=sample_rows), None)
+    sample = batch.to_pylist() if batch is not None else []
+    return {
+        "format": "parquet",
+        "num_rows": parquet_file.metadata.num_rows,
+        "columns": [
+            {"name": field.name, "type": str(field.type)}
+            for field in parquet_file.schema_arrow
+        ],
+        "sample": [[_short(v) for v in row.values()] for row in sample],
+    }
+
+
+def profile_excel(path, scan_rows, sample_rows):
+    import pandas as pd
+
+    sheets = pd.read_excel(path, sheet_name=None, nrows=scan_rows)
+    return {
+        "format": "excel",
+        "sheets": {
+            str(name): {
+                "columns": [
+                    {"name": str(col), "type": str(dtype)}
+                    for col, dtype in df.dtypes.items()
+                ],
+                "rows_scanned": len(df),
+                "sample": [
+                    [_short(v) for v in row]
+                    for row in df.head(sample_rows).itertuples(index=False)
+                ],
+            }
+            for name, df in sheets.items()
+        },
+    }
+
+
+def profile_file(path, scan_rows=1000, sample_rows=5, json_max_bytes=16 * 1024**2):
+    ext = os.path.splitext(path)[1].lower()
+    if ext in (".csv", ".tsv"):
+        return profile_delimited(path, scan_rows, sample_rows)
+    if ext in (".json", ".jsonl", ".ndjson"):
+        return profile_json(path, scan_rows, sample_rows, json_max_bytes)
+    if ext in (".parquet", ".pq"):
+        return profile_parquet(path, sample_rows)
+    if ext in (".xlsx", ".xlsm", ".xls"):
+        return profile_excel(path, scan_rows, sample_rows)
+    if ext in (".db", ".sqlite", ".sqlite3"):
+        return profile_sqlite(path, sample_rows)
+    with open(path, "rb") as f:
+        if f.read(16) == b"SQLite format 3\x00":
+            return profile_sqlite(path, sample_rows)
+    return None
+
+
+def profile_directory(directory=".", scan_rows=1000, sample_rows=5):
+    profiles = {}
+    for name in sorted(os.listdir(directory)):
+        path = os.path.join(directory, name)
+        if name in SKIP_FILES or name.startswith(".") or not os.path.isfile(path):
+            continue
+        try:
+            profile = profile_file(path, scan_rows, sample_rows)
+        except Exception as e:
+            profile = {"error": f"{type(e).__name__}: {e}"}
+        if profile is not None:
+            profile["size_bytes"] = os.path.getsize(path)
+            if os.path.exists(path + ".arrow"):
+                # Written by columnar.py, loading it skips the parse.
+                profile["arrow_copy"] = name + ".arrow"
+            profiles[name] = profile
+    return profiles
@@ -0,0 +1,88 @@
+"""
+DuckDB for generated code, for data too large to load into pandas.
+
+    import sql
+    cases = sql.parquet("data/year=*/court=*/*.parquet")
+    df = sql.query(
+        f"SELECT court, COUNT(*) AS n FROM {cases} WHERE year = 2023 GROUP BY court"
+    )
+
+DuckDB reads Parquet lazily: only the columns a query uses are fetched, row
+groups whose statistics rule out the WHERE clause are skipped, and with hive
+partitioning a filter on a `key=value` directory (year, court, ...) skips
+whole files before they are opened. The same works for s3:// and https://
+URLs through the httpfs extension, which DuckDB loads on first use.
+
+One connection is shared by everything a kernel runs. It is sized to the
+sandbox: its memory limit stays below the kernel's and larger intermediates
+spill to a temp directory in the working directory.
+"""
+
+import json
+import os
+
+SPILL_DIR = ".duckdb_tmp"
+# Leave room under the kernel's address space limit for Python and pandas.
+MEMORY_FRACTION = 0.6
+
+_connection = None
+
+
+def connection():
+    """The kernel's DuckDB connection, created on first use."""
+    global _connection
+    if _connection is None:
+        import duckdb
+
+        config = {"temp_directory": os.path.abspath(SPILL_DIR)}
+        limits = json.loads(os.environ.get("TDS_SANDBOX_LIMITS") or "{}")
+        if limits.get("memory_bytes"):
+            memory_mb = int(limits["memory_bytes"] * MEMORY_FRACTION) // 1024**2
+            config["memory_limit"] = f"{memory_mb}MB"
+        threads = limits.get("threads") or os.environ.get("OMP_NUM_THREADS")
+        if threads:
+            config["threads"] = int(threads)
+        _connection = duckdb.connect(config=config)
+    return _connection
+
+
+def parquet(path, hive_partitioning=True, union_by_name=True):
+    """
+    A `read_parquet(...)` table expression for a file, glob or URL. Paths
+    with `key=value` directories get those keys as columns to filter on.
+    """
+    if isinstance(path, (list, tuple)):
+        source = "[" + ", ".join(_quote(p) for p in path) + "]"
+    else:
+        source = _quote(path)
+    return (
+        f"read_parquet({source}, "
+        f"hive_partitioning={str(hive_partitioning).lower()}, "
+        f"union_by_name={str(union_by_name).lower()})"
+    )
+
+
+def query(sql, params=None):
+    """Runs `sql` and returns the result as a pandas DataFrame."""
+    return connection().execute(sql, params or []).df()
+
+
+def rows(sql, params=None):
+    """Runs `sql` and returns the result as a list of tuples."""
+    return connection().execute(sql, params or []).fetchall()
+
+
+def scalar(sql, params=None):
+    """Runs `sql` and returns the first column of the first row."""
+    row = connection().execute(sql, params or []).fetchone()
+    return row[0] if row else None
+
+
+def explain(sql, params=None):
+    """DuckDB's plan for `sql`, shows which filters reach the Parquet scan."""
+    plan = connection().execute("EXPLAIN " + sql, params or []).fetchall()
+    return "\n".join(line for _, line in plan)
+
+
+def _quote(value):
+    return "'" + str(value).replace("'", "''") + "'"
@@ -1,63 +1,118 @@
+import asyncio
+import json
 import logging
 import os
-import pickle
 import re
+import signal
+import struct
 import subprocess
 import sys
-import uuid
-from tempfile import TemporaryDirectory
-from typing import Any, List, Literal, Optional, Tuple
+import time
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Dict,
+    List,
+    Literal,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+)
 
-from google import genai
-from google.genai import types
-from openai import OpenAI
-from openai.types.chat import ChatCompletionMessageParam
-
-from prompts import optimized_prompt
+from package_cache import PackageCache
+from context import ConversationContext
+from deadline import clamp
+from limits import AdmissionController, Cgroup, SandboxLimits
+from process_utils import kill_process_group, run_command
 from schemas import GeneratedCode
+from metrics import observe_llm_call
+from timing import increment, phase
+
+if TYPE_CHECKING:
+    # The SDKs are imported by whichever provider is in use, see providers.py.
+    from google import genai
+    from openai import AsyncOpenAI
 
 log = logging.getLogger(__name__)
 
+KERNEL_SCRIPT = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "sandbox_runtime", "kernel.py"
+)
+FORKSERVER_SCRIPT = os.path.join(os.path.dirname(KERNEL_SCRIPT), "forkserver.py")
+_FRAME_HEADER = struct.Struct("!I")
+
+
+async def create_venv(venv_path: str, cwd: Optional[str] = None):
+    try:
+        # Using cwd ensures uv commands are run from a predictable location
+        await run_command(["uv", "venv", venv_path], cwd=cwd)
+    except (subprocess.CalledProcessError, FileNotFoundError) as e:
+        log.error(f"Failed to create uv environment. Is 'uv' installed? Error: {e}")
+        raise RuntimeError(
+            f"Failed to create uv environment. Is 'uv' in requirements.txt? Error: {e}"
+        )
+
 
 class UVCodeInterpreter:
-    def __init__(self, temp_dir: str, timeout: int = 300):
+    def __init__(
+        self,
+        temp_dir: str,
+        timeout: int = 300,
+        venv_path: Optional[str] = None,
+        package_cache: Optional[PackageCache] = None,
+        max_result_bytes: int = 32 * 1024**2,
+        limits: Optional[SandboxLimits] = None,
+        admission: Optional[AdmissionController] = None,
+        cgroup_root: str = "",
+        forkserver: Optional["ForkServer"] = None,
+    ):
         self.timeout = timeout
         self.temp_dir = temp_dir
-        self.venv_path = os.path.join(self.temp_dir, ".venv")
+        # A pooled venv lives outside temp_dir, otherwise one is built in place.
+        self.venv_path = venv_path or os.path.join(self.temp_dir, ".venv")
         self.python_executable = os.path.join(self.venv_path, "bin", "python")
         self.stdlib_names = sys.stdlib_module_names
-        self._initialize_venv()
+        self.package_cache = package_cache
+        self.max_result_bytes = max_result_bytes
+        self.limits = limits or SandboxLimits()
+        self.admission = admission
+        self.cgroup_root = cgroup_root
+        # Forked kernels only see the base environment and overlays, not
+        # packages installed into the venv itself.
+        self.forkserver = forkserver if package_cache else None
+        # Set once packages are installed, the venv is no longer pristine.
+        self.dirty = False
+        self.kernel: Optional[SandboxKernel] = None
+        # Overlays the kernel may import from, kept from eviction until exit.
+        self.overlays: Set[str] = set()
 
-    def __enter__(self):
+    async def __aenter__(self):
+        await self._initialize_venv()
         return self
 
-    def __exit__(self, exc_type, exc_val, exc_tb):
-        # Cleanup is now handled by the TemporaryDirectory context manager in main.py
-        # This method is here to support the 'with' statement syntax.
-        pass
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        # The temp dir itself is removed by its owner in app.py
+        # (answer_query, or the candidate and task cleanup), only the kernel
+        # and the overlays it used need releasing here.
+        if self.kernel:
+            await self.kernel.stop()
+        for overlay_path in self.overlays:
+            self.package_cache.release(overlay_path)  # type: ignore
+        self.overlays.clear()
 
-    def _initialize_venv(self):
+    async def _initialize_venv(self):
         if not os.path.exists(self.python_executable):
-            try:
-                # Using cwd ensures uv commands are run from a predictable location
-                subprocess.run(
-                    ["uv", "venv", self.venv_path],
-                    check=True,
-                    capture_output=True,
-                    text=True,
-                    cwd=self.temp_dir,
-                )
-            except (subprocess.CalledProcessError, FileNotFoundError) as e:
-                log.error(
-                    f"Failed to create uv environment. Is 'uv' installed? Error: {e}"
-                )
-                raise RuntimeError(
-                    f"Failed to create uv environment. Is 'uv' in requirements.txt? Error: {e}"
-                )
+            await create_venv(self.venv_path, cwd=self.temp_dir)
 
-    def run(
+    async def run(
         self, code: str, packages: Optional[List[str]] = None
-    ) -> Tuple[str, str, Any]:
+    ) -> Tuple[str, str, Optional[bytes]]:
+        """
+        Executes `code` in the kernel. Returns stdout, stderr and `result`
+        already encoded as JSON bytes (None if the code didn't set it).
+        With an admission controller the execution first waits for a slot.
+        """
         packages = packages or []
         installable_packages = [
             pkg
@@ -65,113 +120,500 @@ class UVCodeInterpreter:
             if re.split(r"[=<>]+", pkg)[0] not in self.stdlib_names
         ]
 
-        if installable_packages:
-            env = os.environ.copy()
-            env["VIRTUAL_ENV"] = self.venv_path
+        overlay_path = None
+        with phase("install"):
+            if installable_packages and self.package_cache:
+                try:
+                    overlay_path = await self.package_cache.resolve(
+                        installable_packages
+                    )
+                except subprocess.CalledProcessError as e:
+                    return ("", f"--- UV INSTALLATION ERROR ---\n{e.stderr}", None)
+                if overlay_path in self.overlays:
+                    self.package_cache.release(overlay_path)
+                elif overlay_path:
+                    self.overlays.add(overlay_path)
+            elif installable_packages:
+                env = os.environ.copy()
+                env["VIRTUAL_ENV"] = self.venv_path
+                try:
+                    command = ["uv", "pip", "install", "--quiet"] + installable_packages
+                    self.dirty = True
+                    await run_command(command, env=env)
+                except subprocess.CalledProcessError as e:
+                    return ("", f"--- UV INSTALLATION ERROR ---\n{e.stderr}", None)
+
+        if self.admission:
+            with phase("admission"):
+                await self.admission.acquire()
+        try:
+            return await self._execute(code, overlay_path)
+        finally:
+            if self.admission:
+                self.admission.release()
+
+    async def _execute(
+        self, code: str, overlay_path: Optional[str]
+    ) -> Tuple[str, str, Optional[bytes]]:
+        stdout, stderr, result = "", "", None
+        # Never let one execution run past the request's own deadline.
+        timeout = clamp(self.timeout)
+
+        forkserver = self.forkserver
+        if forkserver and forkserver.shadowed_by(overlay_path):
+            # The overlay pins something a forked kernel has already imported
+            # from the base, only a fresh interpreter picks up its version.
+            forkserver = None
+            if self.kernel and self.kernel.forked:
+                log.info("Overlay replaces a preloaded package, restarting the kernel.")
+                await self.kernel.stop()
+
+        with phase("execution"):
             try:
-                command = ["uv", "pip", "install", "--quiet"] + installable_packages
-                subprocess.run(
-                    command, check=True, capture_output=True, text=True, env=env
+                if not self.kernel or not self.kernel.alive:
+                    self.kernel = SandboxKernel(
+                        self.python_executable,
+                        self.temp_dir,
+                        self.limits,
+                        self.cgroup_root,
+                        forkserver,
+                    )
+                    await self.kernel.start()
+                ok, stdout, stderr, result_error, payload = await asyncio.wait_for(
+                    self.kernel.execute(
+                        code, self._sys_path(overlay_path), self.max_result_bytes
+                    ),
+                    timeout,
                 )
-            except subprocess.CalledProcessError as e:
-                return ("", f"--- UV INSTALLATION ERROR ---\n{e.stderr}", None)
-
-        result_path = os.path.join(self.temp_dir, f"{uuid.uuid4()}.pkl")
-        injection_code = f"""
-import pickle
-if 'result' in locals():
-    with open('{result_path}', 'wb') as f:
-        pickle.dump(result, f)
-"""
-        full_code = code + "\n" + injection_code
+                if not ok:
+                    stderr = f"--- EXECUTION ERROR ---\n{stderr}"
+                elif result_error:
+                    stderr = f"{stderr}--- RESULT ERROR ---\n{result_error}"
+            except asyncio.TimeoutError:
+                await self.kernel.stop()
+                stderr = f"--- EXECUTION ERROR ---\nCode execution timed out after {timeout:.0f} seconds."
+                return (stdout, stderr, result)
+            except asyncio.CancelledError:
+                # An execution abandoned mid-frame leaves the pipe out of
+                # sync, the kernel can't be reused.
+                if self.kernel:
+                    await self.kernel.stop()
+                raise
+            except (asyncio.IncompleteReadError, ConnectionError):
+                await self.kernel.stop()
+                stderr = "--- EXECUTION ERROR ---\nThe Python process exited unexpectedly, all variables from previous runs are lost."
+                if self.limits.memory_bytes:
+                    stderr += f" It may have exceeded the {self.limits.memory_bytes // 1024**2} MiB memory limit."
+                return (stdout, stderr, result)
 
-        stdout, stderr, result = "", "", None
+        return (stdout, stderr, payload or None)
+
+    async def profile_files(
+        self, scan_rows: int, sample_rows: int
+    ) -> Dict[str, Any]:
+        """Profiles the uploaded files with sandbox_runtime/profiler.py."""
+        code = (
+            "import profiler as _tds_profiler\n"
+            f"result = _tds_profiler.profile_directory('.', {scan_rows}, {sample_rows})\n"
+            "del _tds_profiler"
+        )
+        _, stderr, result = await self.run(code)
+        if stderr or not result:
+            log.warning(f"Profiling uploaded files failed: {stderr[:500]}")
+            return {}
+        return json.loads(result)
+
+    def _sys_path(self, overlay_path: Optional[str]) -> List[str]:
+        # The overlay goes first so its pins win over the shared base stack.
+        paths = [overlay_path]
+        if self.package_cache:
+            paths.append(self.package_cache.base_site_packages)
+        return [path for path in paths if path]
+
+
+def kernel_env(limits: SandboxLimits) -> Dict[str, str]:
+    env = os.environ.copy()
+    env["MPLBACKEND"] = "Agg"
+    env["TQDM_DISABLE"] = "1"
+    env["HF_HUB_DISABLE_PROGRESS_BARS"] = "1"
+    env["PYTHONUNBUFFERED"] = "1"
+    env.update(limits.kernel_env())
+    return env
+
+
+async def _read_frame(reader: asyncio.StreamReader) -> bytes:
+    header = await reader.readexactly(_FRAME_HEADER.size)
+    (length,) = _FRAME_HEADER.unpack(header)
+    return await reader.readexactly(length)
+
+
+def _write_frame(writer: asyncio.StreamWriter, payload: bytes):
+    writer.write(_FRAME_HEADER.pack(len(payload)) + payload)
+
+
+class ForkServer:
+    """
+    A `sandbox_runtime/forkserver.py` process running with the base
+    environment's interpreter. It has the heavy modules imported already and
+    forks a fresh kernel per `spawn`, which saves each kernel those imports.
+    """
+
+    def __init__(
+        self,
+        python_executable: str,
+        sys_path: List[str],
+        socket_path: str,
+        preload: List[str],
+        limits: SandboxLimits,
+    ):
+        self.python_executable = python_executable
+        self.sys_path = sys_path
+        self.socket_path = socket_path
+        self.preload = preload
+        self.limits = limits
+        self.proc: Optional[asyncio.subprocess.Process] = None
+        self.preload_seconds = 0.0
+        # Top-level packages a forked kernel has imported before it starts.
+        self.preloaded: Set[str] = {name.split(".")[0] for name in preload}
+        self._shadowed: Dict[str, bool] = {}
+        self.forks = 0
+        self.fork_seconds = 0.0
+        self.failures = 0
+
+    @property
+    def ready(self) -> bool:
+        return self.proc is not None and self.proc.returncode is None
+
+    async def start(self, timeout: float = 120):
+        env = kernel_env(self.limits)
+        env["PYTHONPATH"] = os.pathsep.join(self.sys_path)
+        self.proc = await asyncio.create_subprocess_exec(
+            self.python_executable,
+            FORKSERVER_SCRIPT,
+            self.socket_path,
+            *self.preload,
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL,
+            env=env,
+            start_new_session=True,
+        )
+        assert self.proc.stdout
+        try:
+            line = await asyncio.wait_for(self.proc.stdout.readline(), timeout)
+            status = json.loads(line)
+        except (asyncio.TimeoutError, ValueError):
+            await self.stop()
+            raise RuntimeError("Forkserver did not start.")
+        self.preload_seconds = status["preload_seconds"]
+        self.preloaded.update(status.get("packages", ()))
+        for failure in status["failed"]:
+            log.warning(f"Forkserver could not preload {failure}")
+        log.info(
+            f"Forkserver ready, preloading {self.preload} took "
+            f"{self.preload_seconds:.2f}s."
+        )
+
+    def shadowed_by(self, overlay_path: Optional[str]) -> bool:
+        """
+        Whether the overlay holds a package forked kernels have already
+        imported from the base environment. Its version would be ignored.
+        """
+        if not overlay_path:
+            return False
+        if overlay_path not in self._shadowed:
+            try:
+                entries = os.listdir(overlay_path)
+            except OSError:
+                entries = []
+            names = {
+                entry.split(".")[0]
+                for entry in entries
+                if not entry.endswith((".dist-info", ".egg-info", ".pth"))
+            }
+            self._shadowed[overlay_path] = bool(names & self.preloaded)
+        return self._shadowed[overlay_path]
 
+    async def spawn(
+        self, cwd: str, env: Dict[str, str]
+    ) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter, int]:
+        """A new kernel in `cwd`: its stream pair and pid."""
+        start = time.perf_counter()
+        reader, writer = await asyncio.open_unix_connection(self.socket_path)
         try:
-            exec_env = os.environ.copy()
-            exec_env["MPLBACKEND"] = "Agg"
-            exec_env["TQDM_DISABLE"] = "1"
-            exec_env["HF_HUB_DISABLE_PROGRESS_BARS"] = "1"
-
-            proc = subprocess.run(
-                [self.python_executable, "-c", full_code],
-                check=True,
-                capture_output=True,
-                text=True,
-                timeout=self.timeout,
-                env=exec_env,
-                cwd=self.temp_dir,  # CRITICAL: This makes the code run in the correct directory
+            _write_frame(writer, json.dumps({"cwd": cwd, "env": env}).encode())
+            await writer.drain()
+            pid = json.loads(await _read_frame(reader))["pid"]
+        except BaseException:
+            self.failures += 1
+            writer.close()
+            raise
+        self.forks += 1
+        self.fork_seconds += time.perf_counter() - start
+        increment("kernel_startup_saved_seconds", self.preload_seconds)
+        return reader, writer, pid
+
+    async def stop(self):
+        if self.proc:
+            await kill_process_group(self.proc)
+            self.proc = None
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "ready": self.ready,
+            "preload_seconds": round(self.preload_seconds, 3),
+            "forks": self.forks,
+            "failures": self.failures,
+            "avg_fork_seconds": round(self.fork_seconds / max(1, self.forks), 4),
+            "startup_saved_seconds": round(self.forks * self.preload_seconds, 1),
+        }
+
+
+# Seconds to wait for a killed forked kernel to exit.
+KERNEL_EXIT_TIMEOUT = 5
+
+
+class SandboxKernel:
+    """
+    A long-lived `sandbox_runtime/kernel.py` process. It keeps its namespace
+    between executions so refinement iterations don't pay interpreter start,
+    imports and file loading again.
+    """
+
+    def __init__(
+        self,
+        python_executable: str,
+        cwd: str,
+        limits: Optional[SandboxLimits] = None,
+        cgroup_root: str = "",
+        forkserver: Optional[ForkServer] = None,
+    ):
+        self.python_executable = python_executable
+        self.cwd = cwd
+        self.limits = limits or SandboxLimits()
+        self.cgroup_root = cgroup_root
+        self.forkserver = forkserver
+        self.proc: Optional[asyncio.subprocess.Process] = None
+        self.pid: Optional[int] = None
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+        self.cgroup: Optional[Cgroup] = None
+        self.forked = False
+
+    @property
+    def alive(self) -> bool:
+        if self.proc is not None:
+            return self.proc.returncode is None
+        # Forked kernels aren't our children, their stream closes on exit.
+        return self.reader is not None and not self.reader.at_eof()
+
+    async def start(self):
+        env = kernel_env(self.limits)
+        if self.forkserver and self.forkserver.ready:
+            try:
+                self.reader, self.writer, self.pid = await self.forkserver.spawn(
+                    self.cwd, env
+                )
+                self.forked = True
+            except (OSError, asyncio.IncompleteReadError, ValueError) as e:
+                log.warning(f"Forkserver spawn failed, starting a new process: {e}")
+        if self.pid is None:
+            self.proc = await asyncio.create_subprocess_exec(
+                self.python_executable,
+                KERNEL_SCRIPT,
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.DEVNULL,
+                env=env,
+                cwd=self.cwd,  # CRITICAL: This makes the code run in the correct directory
+                start_new_session=True,
             )
-            stdout = proc.stdout
-            stderr = proc.stderr
-        except subprocess.CalledProcessError as e:
-            stdout = e.stdout
-            stderr = f"--- EXECUTION ERROR ---\n{e.stderr}"
-        except subprocess.TimeoutExpired:
-            stderr = f"--- EXECUTION ERROR ---\nCode execution timed out after {self.timeout} seconds."
-        finally:
-            if os.path.exists(result_path):
+            self.pid = self.proc.pid
+            self.reader, self.writer = self.proc.stdout, self.proc.stdin
+        # The kernel blocks on its first request, so nothing runs before it
+        # has been moved into its cgroup.
+        self.cgroup = Cgroup.create(self.cgroup_root, self.limits)
+        if self.cgroup:
+            try:
+                self.cgroup.add(self.pid)
+            except OSError as e:
+                log.warning(f"Could not move kernel into {self.cgroup.path}: {e}")
+
+    async def execute(
+        self, code: str, sys_path: List[str], max_result_bytes: int
+    ) -> Tuple[bool, str, str, Optional[str], bytes]:
+        assert self.reader and self.writer
+        request = json.dumps(
+            {"code": code, "sys_path": sys_path, "max_result_bytes": max_result_bytes}
+        ).encode()
+        _write_frame(self.writer, request)
+        await self.writer.drain()
+        reply = json.loads(await _read_frame(self.reader))
+        payload = await _read_frame(self.reader)
+        return (
+            reply["ok"],
+            reply["stdout"],
+            reply["stderr"],
+            reply["result_error"],
+            payload,
+        )
+
+    async def stop(self):
+        if self.proc:
+            # The kernel leads its own session, take its children with it.
+            await kill_process_group(self.proc)
+        elif self.pid is not None:
+            try:
+                os.killpg(self.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            if self.reader:
+                # The kill is asynchronous and a cgroup can only be removed
+                # once empty. The socket reaches EOF when the kernel is gone.
                 try:
-                    with open(result_path, "rb") as f:
-                        result = pickle.load(f)
-                except Exception as load_error:
-                    result = {
-                        "error": "Failed to deserialize result variable",
-                        "details": str(load_error),
-                    }
-        return (stdout, stderr, result)
+                    await asyncio.wait_for(self.reader.read(), KERNEL_EXIT_TIMEOUT)
+                except (asyncio.TimeoutError, ConnectionError):
+                    log.warning(f"Forked kernel {self.pid} did not exit in time.")
+            if self.writer:
+                self.writer.close()
+        self.proc = self.pid = self.reader = self.writer = None
+        if self.cgroup:
+            self.cgroup.remove()
+            self.cgroup = None
+
+
+def _record_usage(prompt_tokens: int, completion_tokens: int, estimated: int):
+    log.info(
+        f"LLM call used {prompt_tokens} prompt (~{estimated} estimated) + {completion_tokens} completion tokens"
+    )
+    increment("llm_calls")
+    increment("llm_prompt_tokens", prompt_tokens)
+    increment("llm_completion_tokens", completion_tokens)
+    observe_llm_call(prompt_tokens, completion_tokens)
 
 
 class LLMClient:
+    """
+    One request's conversation with a provider. The SDK client is shared
+    (see providers.ProviderRegistry), so creating a session is cheap.
+    """
+
     def __init__(
         self,
-        api_key: str,
-        digital_ocean_model_access_key: str,
-        digital_ocean_model_access_base_url: str,
+        client: Union["AsyncOpenAI", "genai.Client"],
         provider: Literal["gemini", "openai"] = "gemini",
+        context_token_budget: int = 24000,
+        context_keep_recent: int = 4,
     ) -> None:
-        print(f"Using {provider} as provider")
-        self.chat_history = [{"role": "system", "content": optimized_prompt}]
+        from prompts import optimized_prompt
+
+        # The conversation is kept here rather than in a provider chat object
+        # so older turns can be summarized before every call.
+        self.system_prompt = optimized_prompt
+        self.context = ConversationContext(
+            optimized_prompt, context_token_budget, context_keep_recent
+        )
         self.provider = provider
-        if provider == "openai":
-            self.client = OpenAI(
-                base_url=digital_ocean_model_access_base_url,
-                api_key=digital_ocean_model_access_key,
-            )
-        else:
-            self.client = genai.Client(api_key=api_key)
-            self.chat = self.client.chats.create(
-                model="gemini-2.5-flash",
-                config=types.GenerateContentConfig(
-                    thinking_config=types.ThinkingConfig(thinking_budget=0),
-                    max_output_tokens=4096,
-                    system_instruction=optimized_prompt,
-                    response_mime_type="application/json",
-                    response_schema=GeneratedCode,
-                    temperature=0,
-                ),
+        self.client = client
+        if provider == "gemini":
+            from google.genai import types
+
+            self.config = types.GenerateContentConfig(
+                thinking_config=types.ThinkingConfig(thinking_budget=0),
+                max_output_tokens=4096,
+                system_instruction=optimized_prompt,
+                response_mime_type="application/json",
+                response_schema=GeneratedCode,
+                temperature=0,
             )
 
-    def generate_code(self, prompt: str) -> GeneratedCode:
+    def fork(self) -> "LLMClient":
+        """A fresh conversation on the same provider client."""
+        return LLMClient(
+            self.client,
+            self.provider,
+            self.context.token_budget,
+            self.context.keep_recent,
+        )
+
+    async def generate_code(self, prompt: str) -> GeneratedCode:
+        (response,) = await self.generate_candidates(prompt, 1)
+        return response
+
+    async def generate_candidates(
+        self, prompt: str, n: int, temperature: float = 0
+    ) -> List[GeneratedCode]:
+        """
+        Asks for `n` alternative replies to `prompt` in one call. The first
+        is recorded in the conversation, `record_reply` switches to another.
+        """
+        self.context.add_user(prompt)
+        messages = self.context.messages()
+        estimated = self.context.estimated_tokens()
         if self.provider == "openai":
-            client: OpenAI = self.client  # type: ignore
-            self.chat_history.append({"content": prompt, "role": "user"})
-            response = client.chat.completions.parse(
+            client: "AsyncOpenAI" = self.client  # type: ignore
+            chat_messages = [{"role": "system", "content": self.system_prompt}]
+            response = await client.chat.completions.parse(
                 model="openai-gpt-5",
-                messages=self.chat_history,  # type: ignore
+                messages=chat_messages + messages,  # type: ignore
                 max_tokens=4096,
                 response_format=GeneratedCode,
                 reasoning_effort="low",
-                temperature=0
+                temperature=temperature,
+                n=n,
             )
-            message = response.choices[0].message
-            parsed_response = GeneratedCode.model_validate(message.parsed)
-            self.chat_history.append(
-                {"role": "assistant", "content": str(message.content)}
-            )
-            return parsed_response
+            if response.usage:
+                _record_usage(
+                    response.usage.prompt_tokens,
+                    response.usage.completion_tokens,
+                    estimated,
+                )
+            candidates = [
+                GeneratedCode.model_validate(choice.message.parsed)
+                for choice in response.choices
+                if choice.message.parsed
+            ]
         else:
-            response = self.chat.send_message(prompt)
-            print(response.text)
-            parsed_response = GeneratedCode.model_validate(response.parsed)
-            return parsed_response
+            from google.genai import types
+
+            config = self.config
+            if n > 1:
+                config = config.model_copy(
+                    update={"candidate_count": n, "temperature": temperature}
+                )
+            response = await self.client.aio.models.generate_content(  # type: ignore
+                model="gemini-2.5-flash",
+                contents=[
+                    types.Content(
+                        role="model" if m["role"] == "assistant" else "user",
+                        parts=[types.Part(text=m["content"])],
+                    )
+                    for m in messages
+                ],
+                config=config,
+            )
+            if response.usage_metadata:
+                _record_usage(
+                    response.usage_metadata.prompt_token_count or 0,
+                    response.usage_metadata.candidates_token_count or 0,
+                    estimated,
+                )
+            candidates = []
+            for candidate in response.candidates or []:
+                parts = candidate.content.parts if candidate.content else None
+                text = "".join(part.text or "" for part in parts or [])
+                log.debug(f"Gemini candidate: {text}")
+                try:
+                    candidates.append(GeneratedCode.model_validate_json(text))
+                except ValueError:
+                    log.warning("Dropping a candidate that didn't match the schema.")
+        if not candidates:
+            raise ValueError("LLM returned no usable candidates.")
+        self.context.add_assistant(candidates[0].model_dump_json())
+        return candidates
+
+    def record_reply(self, reply: GeneratedCode):
+        """Makes `reply` the assistant turn the conversation continues from."""
+        self.context.replace_last_reply(reply.model_dump_json())
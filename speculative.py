@@ -0,0 +1,85 @@
+import asyncio
+import fcntl
+import logging
+import os
+import shutil
+from typing import List, NamedTuple, Optional, Sequence
+
+from schemas import GeneratedCode
+from services import UVCodeInterpreter
+
+log = logging.getLogger(__name__)
+
+# Linux FICLONE ioctl: a copy-on-write clone on btrfs, XFS and similar.
+_FICLONE = 0x40049409
+
+
+class Outcome(NamedTuple):
+    index: int
+    stdout: str
+    stderr: str
+    result: Optional[bytes]
+
+
+class RoundResult(NamedTuple):
+    winner: Optional[Outcome]
+    # Failed or unfinished candidates, in the order they completed.
+    failures: List[Outcome]
+
+
+def _clone(src: str, dst: str):
+    with open(src, "rb") as source, open(dst, "wb") as target:
+        try:
+            fcntl.ioctl(target.fileno(), _FICLONE, source.fileno())
+            return
+        except OSError:
+            pass
+        shutil.copyfileobj(source, target, 1024**2)
+    shutil.copystat(src, dst)
+
+
+def copy_inputs(src_dir: str, dst_dir: str):
+    """
+    Copies the uploaded files into a candidate's or task's working directory.
+    Generated code may overwrite its inputs (df.to_csv("sales.csv")), so no
+    inode is shared with the other sandboxes. The copy is a reflink where the
+    filesystem supports it, which makes it free for large uploads.
+    """
+    for name in os.listdir(src_dir):
+        src = os.path.join(src_dir, name)
+        if name.startswith(".") or not os.path.isfile(src):
+            continue
+        _clone(src, os.path.join(dst_dir, name))
+
+
+async def first_success(
+    sandboxes: Sequence[UVCodeInterpreter], candidates: Sequence[GeneratedCode]
+) -> RoundResult:
+    """
+    Runs candidate i in sandbox i concurrently and returns as soon as one
+    finishes cleanly with `is_final_answer`. The others are cancelled, which
+    stops their kernels.
+    """
+
+    async def run(index: int) -> Outcome:
+        candidate = candidates[index]
+        stdout, stderr, result = await sandboxes[index].run(
+            candidate.code, candidate.libraries
+        )
+        return Outcome(index, stdout, stderr, result)
+
+    tasks = [asyncio.create_task(run(i)) for i in range(len(candidates))]
+    failures: List[Outcome] = []
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            outcome = await next_done
+            if not outcome.stderr and candidates[outcome.index].is_final_answer:
+                if len(candidates) > 1:
+                    log.info(f"Candidate #{outcome.index + 1} won the round.")
+                return RoundResult(outcome, failures)
+            failures.append(outcome)
+        return RoundResult(None, failures)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,73 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional
+
+
+@dataclass
+class RequestTrace:
+    """
+    Everything measured while handling one request: summed time per phase,
+    the individual spans, and counters like iterations or bytes uploaded.
+    """
+
+    start: float = field(default_factory=time.perf_counter)
+    phases: Dict[str, float] = field(default_factory=dict)
+    spans: List[Dict[str, Any]] = field(default_factory=list)
+    attributes: Dict[str, Any] = field(default_factory=dict)
+
+    def server_timing(self, total: float) -> str:
+        entries = [
+            f"{name};dur={seconds * 1000:.1f}" for name, seconds in self.phases.items()
+        ]
+        entries.append(f"total;dur={total * 1000:.1f}")
+        return ", ".join(entries)
+
+
+# The trace object is shared by reference with tasks spawned while handling
+# the request, so their phases land in the same place.
+_trace: ContextVar[Optional[RequestTrace]] = ContextVar("request_trace", default=None)
+
+
+def start_request() -> RequestTrace:
+    trace = RequestTrace()
+    _trace.set(trace)
+    return trace
+
+
+def current_trace() -> Optional[RequestTrace]:
+    return _trace.get()
+
+
+def set_attribute(key: str, value: Any):
+    trace = _trace.get()
+    if trace is not None:
+        trace.attributes[key] = value
+
+
+def increment(key: str, amount: float = 1):
+    trace = _trace.get()
+    if trace is not None:
+        trace.attributes[key] = trace.attributes.get(key, 0) + amount
+
+
+@contextmanager
+def phase(name: str, **attributes: Any) -> Iterator[None]:
+    """Records a span for the block and adds its time to `name`."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace = _trace.get()
+        if trace is not None:
+            duration = time.perf_counter() - start
+            trace.phases[name] = trace.phases.get(name, 0.0) + duration
+            trace.spans.append(
+                {
+                    "name": name,
+                    "offset_ms": round((start - trace.start) * 1000, 1),
+                    "duration_ms": round(duration * 1000, 1),
+                    **attributes,
+                }
+            )
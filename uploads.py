@@ -0,0 +1,171 @@
+import hashlib
+import logging
+import os
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import aiofiles
+from fastapi import HTTPException, Request, status
+from python_multipart.exceptions import ParseError
+from python_multipart.multipart import MultipartParser, parse_options_header
+
+log = logging.getLogger(__name__)
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+class UploadedFile(NamedTuple):
+    size: int
+    sha256: str
+
+
+class _PartCollector:
+    """
+    Callbacks for `MultipartParser`. They only record what happened, the
+    actual disk writes are awaited by `save_files_to_temp_dir` between chunks
+    so the event loop never blocks on file IO.
+    """
+
+    def __init__(self, max_file_bytes: int):
+        self.max_file_bytes = max_file_bytes
+        self.events: List[Tuple[str, Optional[bytes]]] = []
+        self._header_field = b""
+        self._header_value = b""
+        self._disposition = b""
+        self._is_file = False
+        self._part_bytes = 0
+
+    def callbacks(self) -> dict:
+        return {
+            "on_part_begin": self.on_part_begin,
+            "on_part_data": self.on_part_data,
+            "on_part_end": self.on_part_end,
+            "on_header_field": self.on_header_field,
+            "on_header_value": self.on_header_value,
+            "on_header_end": self.on_header_end,
+            "on_headers_finished": self.on_headers_finished,
+        }
+
+    def on_part_begin(self):
+        self._disposition = b""
+        self._is_file = False
+        self._part_bytes = 0
+
+    def on_header_field(self, data: bytes, start: int, end: int):
+        self._header_field += data[start:end]
+
+    def on_header_value(self, data: bytes, start: int, end: int):
+        self._header_value += data[start:end]
+
+    def on_header_end(self):
+        if self._header_field.lower() == b"content-disposition":
+            self._disposition = self._header_value
+        self._header_field = b""
+        self._header_value = b""
+
+    def on_headers_finished(self):
+        _, options = parse_options_header(self._disposition)
+        # Only file parts are kept, plain form fields were never used.
+        if b"filename" in options and b"name" in options:
+            self._is_file = True
+            self.events.append(("open", options[b"name"]))
+
+    def on_part_data(self, data: bytes, start: int, end: int):
+        if not self._is_file:
+            return
+        self._part_bytes += end - start
+        if self._part_bytes > self.max_file_bytes:
+            raise UploadTooLarge(
+                f"Uploaded file exceeds the limit of {self.max_file_bytes} bytes."
+            )
+        self.events.append(("data", bytes(data[start:end])))
+
+    def on_part_end(self):
+        if self._is_file:
+            self.events.append(("close", None))
+
+
+def _safe_filename(field_name: bytes) -> str:
+    # The form field name becomes the file name, so it must not escape temp_dir.
+    name = os.path.basename(field_name.decode("utf-8", errors="replace"))
+    if name in ("", ".", ".."):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid upload field name '{name}'.",
+        )
+    return name
+
+
+async def save_files_to_temp_dir(
+    req: Request, temp_dir: str, max_file_bytes: int, max_request_bytes: int
+) -> Dict[str, UploadedFile]:
+    """
+    Streams the multipart body straight into `temp_dir`, using each form
+    field's key as the filename. Nothing is spooled or buffered in full, and
+    the request is rejected as soon as a per-file or per-request limit is
+    crossed. Returns the saved filenames with their sizes and content hashes.
+    """
+    content_length = req.headers.get("content-length")
+    if content_length and content_length.isdigit():
+        if int(content_length) > max_request_bytes:
+            raise HTTPException(
+                status_code=413,
+                detail=f"Request body exceeds the limit of {max_request_bytes} bytes.",
+            )
+
+    _, params = parse_options_header(req.headers["content-type"])
+    if b"boundary" not in params:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Missing boundary in multipart.",
+        )
+
+    collector = _PartCollector(max_file_bytes)
+    parser = MultipartParser(params[b"boundary"], collector.callbacks())
+    sizes: Dict[str, int] = {}
+    digests: Dict[str, "hashlib._Hash"] = {}
+    current = None
+    current_name = ""
+    received = 0
+    try:
+        async for chunk in req.stream():
+            received += len(chunk)
+            if received > max_request_bytes:
+                raise UploadTooLarge(
+                    f"Request body exceeds the limit of {max_request_bytes} bytes."
+                )
+            parser.write(chunk)
+            for event, payload in collector.events:
+                if event == "open":
+                    current_name = _safe_filename(payload)  # type: ignore
+                    current = await aiofiles.open(
+                        os.path.join(temp_dir, current_name), "wb"
+                    )
+                    sizes[current_name] = 0
+                    digests[current_name] = hashlib.sha256()
+                elif event == "data" and current:
+                    await current.write(payload)
+                    sizes[current_name] += len(payload)  # type: ignore
+                    digests[current_name].update(payload)  # type: ignore
+                elif event == "close" and current:
+                    await current.close()
+                    current = None
+            collector.events.clear()
+        parser.finalize()
+    except UploadTooLarge as e:
+        log.warning(f"Rejected upload: {e}")
+        raise HTTPException(status_code=413, detail=str(e))
+    except ParseError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Malformed multipart body: {e}",
+        )
+    finally:
+        if current:
+            await current.close()
+
+    return {
+        name: UploadedFile(size, digests[name].hexdigest())
+        for name, size in sizes.items()
+    }
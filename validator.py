@@ -0,0 +1,306 @@
+import ast
+import functools
+import importlib.metadata
+import os
+import re
+import sys
+from collections import Counter
+from typing import Dict, FrozenSet, List, NamedTuple, Optional, Set
+
+from package_cache import canonical_name
+from schemas import GeneratedCode
+
+# Import names whose distribution is called something else on PyPI.
+IMPORT_TO_DIST = {
+    "bs4": "beautifulsoup4",
+    "community": "python-louvain",
+    "cv2": "opencv-python-headless",
+    "dateutil": "python-dateutil",
+    "docx": "python-docx",
+    "dotenv": "python-dotenv",
+    "fitz": "pymupdf",
+    "google.genai": "google-genai",
+    "igraph": "python-igraph",
+    "magic": "python-magic",
+    "mpl_toolkits": "matplotlib",
+    "PIL": "pillow",
+    "pptx": "python-pptx",
+    "skimage": "scikit-image",
+    "sklearn": "scikit-learn",
+    "yaml": "pyyaml",
+}
+
+# Calls that create files whose names don't appear in the code.
+_CREATORS = {
+    "extract",
+    "extractall",
+    "unpack_archive",
+    "urlretrieve",
+    "download",
+    "download_file",
+    "system",
+    "run",
+    "call",
+    "check_call",
+    "check_output",
+    "Popen",
+}
+_GLOB_CHARS = set("*?[")
+_METADATA_DIRS = (".dist-info", ".data", "__pycache__", "..")
+
+# Calls whose first argument is a path the code expects to read.
+_READERS = {
+    "open",
+    "read_csv",
+    "read_table",
+    "read_json",
+    "read_parquet",
+    "read_feather",
+    "read_excel",
+    "read_orc",
+    "read_stata",
+    "read_sas",
+    "read_spss",
+    "read_pickle",
+    "read_fwf",
+    "read_html",
+    "read_xml",
+    "ParquetFile",
+    "ExcelFile",
+    "load",
+    "loadtxt",
+    "genfromtxt",
+    "read_file",
+    "read_graphml",
+    "read_edgelist",
+    "read_gml",
+    "read_adjlist",
+}
+_WRITE_MODES = set("wax")
+_REQUIREMENT_NAME = re.compile(r"[\s\[=<>!~;]")
+
+SANDBOX_RUNTIME_DIR = os.path.join(os.path.dirname(__file__), "sandbox_runtime")
+
+
+class Preflight(NamedTuple):
+    diagnostics: List[str]
+    # `libraries` from the LLM plus what the imports need.
+    libraries: List[str]
+
+    @property
+    def ok(self) -> bool:
+        return not self.diagnostics
+
+    def feedback(self) -> str:
+        lines = "\n".join(f"- {d}" for d in self.diagnostics)
+        return (
+            "--- PRE-FLIGHT CHECK FAILED ---\n"
+            "The code was not run because static checks found problems:\n"
+            f"{lines}"
+        )
+
+
+def _sandbox_modules() -> Set[str]:
+    # Helper modules the kernel puts on sys.path, e.g. the file profiler.
+    return {
+        name[:-3]
+        for name in os.listdir(SANDBOX_RUNTIME_DIR)
+        if name.endswith(".py")
+    }
+
+
+def _call_name(func: ast.expr) -> Optional[str]:
+    if isinstance(func, ast.Name):
+        return func.id
+    if isinstance(func, ast.Attribute):
+        return func.attr
+    return None
+
+
+def _opens_for_write(call: ast.Call) -> bool:
+    mode = call.args[1] if len(call.args) > 1 else None
+    for keyword in call.keywords:
+        if keyword.arg == "mode":
+            mode = keyword.value
+    return (
+        isinstance(mode, ast.Constant)
+        and isinstance(mode.value, str)
+        and bool(_WRITE_MODES & set(mode.value))
+    )
+
+
+@functools.lru_cache(maxsize=4)
+def installed_modules(site_packages: Optional[str]) -> Dict[str, FrozenSet[str]]:
+    """
+    Top-level import names of every distribution installed in `site_packages`
+    (the server's own environment for None), by canonical distribution name.
+    """
+    path = [site_packages] if site_packages else sys.path
+    provided: Dict[str, Set[str]] = {}
+    for dist in importlib.metadata.distributions(path=path):
+        name = dist.metadata["Name"]
+        if not name:
+            continue
+        names = set((dist.read_text("top_level.txt") or "").split())
+        if not names:
+            # No top_level.txt (most non-setuptools wheels), use the files.
+            for file in dist.files or []:
+                top = file.parts[0]
+                if len(file.parts) == 1 and top.endswith(".py"):
+                    names.add(top[:-3])
+                elif len(file.parts) > 1 and not top.endswith(_METADATA_DIRS):
+                    names.add(top)
+        provided.setdefault(canonical_name(name), set()).update(names)
+    return {name: frozenset(names) for name, names in provided.items()}
+
+
+def provided_modules(dists: Set[str], base_site_packages: Optional[str]) -> Set[str]:
+    """
+    Import names already covered by the canonical distribution names `dists`
+    or by anything installed in the base environment.
+    """
+    known = installed_modules(None)
+    provided = {
+        module
+        for module, dist in IMPORT_TO_DIST.items()
+        if canonical_name(dist) in dists
+    }
+    for dist in dists:
+        provided.add(dist.replace("-", "_"))
+        provided.update(known.get(dist, ()))
+    if base_site_packages:
+        for names in installed_modules(base_site_packages).values():
+            provided.update(names)
+    return provided
+
+
+def required_distributions(
+    tree: ast.AST, local_modules: Set[str], provided: Set[str] = frozenset()
+) -> List[str]:
+    """
+    Third-party distributions the code imports, by their PyPI names. Imports
+    whose module is in `provided` are skipped.
+    """
+    dists = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names = [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.level == 0 and node.module:
+            names = [node.module]
+        else:
+            continue
+        for name in names:
+            top = name.split(".")[0]
+            dotted = ".".join(name.split(".")[:2])
+            if (
+                top in sys.stdlib_module_names
+                or top in local_modules
+                or top in provided
+                or dotted in provided
+            ):
+                continue
+            dist = IMPORT_TO_DIST.get(dotted) or IMPORT_TO_DIST.get(top, top)
+            dists.append(dist)
+    return dists
+
+
+def _assigns_result(tree: ast.AST) -> bool:
+    for node in ast.walk(tree):
+        if (
+            isinstance(node, ast.Name)
+            and node.id == "result"
+            and isinstance(node.ctx, ast.Store)
+        ):
+            return True
+        if isinstance(node, ast.Global) and "result" in node.names:
+            return True
+    return False
+
+
+def _string(node: ast.expr) -> Optional[str]:
+    if isinstance(node, ast.Constant) and isinstance(node.value, str):
+        return node.value
+    return None
+
+
+def _missing_files(tree: ast.AST, work_dir: str) -> List[str]:
+    read: List[str] = []
+    constants: Counter = Counter()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Constant) and isinstance(node.value, str):
+            constants[node.value] += 1
+        if not isinstance(node, ast.Call):
+            continue
+        name = _call_name(node.func)
+        if name in _CREATORS:
+            # Files come out of an archive, a download or a subprocess, the
+            # script's inputs can't be known statically.
+            return []
+        if node.args and name in _READERS and not _opens_for_write(node):
+            path = _string(node.args[0])
+            if path is not None:
+                read.append(path)
+
+    missing = []
+    for value in read:
+        if (
+            not value
+            # Used elsewhere too, e.g. df.to_csv("x.csv"), urlretrieve(url,
+            # "x.csv") or out = "x.csv" earlier in the same script.
+            or constants[value] > read.count(value)
+            or value in missing
+            or "://" in value
+            or value.startswith(":")
+            or os.path.isabs(value)
+            or "\n" in value
+            or _GLOB_CHARS & set(value)
+        ):
+            continue
+        if not os.path.exists(os.path.join(work_dir, value)):
+            missing.append(value)
+    return missing
+
+
+def validate(
+    code: GeneratedCode, work_dir: str, base_site_packages: Optional[str] = None
+) -> Preflight:
+    """
+    Static checks that need neither a sandbox nor an LLM call: syntax, a
+    `result` assignment in final answers, and reads of files that aren't in
+    `work_dir`. Also fills in libraries the imports need that neither the
+    LLM's list nor the base environment provides.
+    """
+    try:
+        tree = ast.parse(code.code)
+    except SyntaxError as e:
+        location = f"line {e.lineno}" + (f", column {e.offset}" if e.offset else "")
+        snippet = f": {e.text.strip()}" if e.text else ""
+        diagnostic = f"SyntaxError at {location}: {e.msg}{snippet}"
+        return Preflight([diagnostic], code.libraries)
+
+    diagnostics = []
+    if code.is_final_answer and not _assigns_result(tree):
+        diagnostics.append(
+            "is_final_answer is true but the code never assigns the `result` variable."
+        )
+    missing = _missing_files(tree, work_dir)
+    if missing:
+        available = sorted(
+            name for name in os.listdir(work_dir) if not name.startswith(".")
+        )
+        diagnostics.append(
+            f"The code reads {', '.join(repr(m) for m in missing)} which "
+            f"{'does' if len(missing) == 1 else 'do'} not exist. "
+            f"Files in the working directory: {', '.join(available) or 'none'}."
+        )
+
+    listed = {
+        canonical_name(_REQUIREMENT_NAME.split(lib)[0]) for lib in code.libraries
+    }
+    libraries = list(code.libraries)
+    provided = provided_modules(listed, base_site_packages)
+    for dist in required_distributions(tree, _sandbox_modules(), provided):
+        if canonical_name(dist) not in listed:
+            listed.add(canonical_name(dist))
+            libraries.append(dist)
+    return Preflight(diagnostics, libraries)